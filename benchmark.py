@@ -0,0 +1,157 @@
+"""
+Microbenchmarks of the move logic hot functions over a corpus of realistic payloads.
+
+    python benchmark.py --save baseline.json          # record a baseline
+    python benchmark.py --compare baseline.json       # fails if a function got slower than the threshold
+
+The corpus is generated by simulated games played with a fixed seeded policy, so it does
+not change when the strategy does and results stay comparable between versions.
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+
+from board import Board, MOVES
+import evaluation
+import parsing
+import pathfinding
+import server_logic
+import simulator
+
+# (name, ruleset, snakes, width, height, turn)
+CORPUS = (
+    ("empty_11x11", "standard", 2, 11, 11, 0),
+    ("crowded_royale", "royale", 8, 11, 11, 40),
+    ("large_25x25", "standard", 8, 25, 25, 80),
+    ("long_constrictor", "constrictor", 4, 11, 11, 30),
+    ("wrapped", "wrapped", 4, 11, 11, 80),
+)
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_DIFFERENCE_US = 1.0
+REPEATS = 5
+
+def corpus_policy(rng: random.Random):
+    """
+    Random moves among those that are safe and lead to enough room, independent from server_logic
+    so the corpus does not change with the strategy.
+    """
+    def policy(data: dict) -> str:
+        board, you = Board.from_data(data), data["you"]
+        moves = board.avoid_blocked(board.generate_possible_moves(board.index(you["head"])))
+        moves = board.avoid_head_to_head(moves, data["board"]["snakes"], you["length"], you["id"]) or moves
+        roomy = [m for m, cell in moves.items() if pathfinding.bfs(board, {m: cell}).reachable() >= you["length"]]
+        return rng.choice(roomy or list(moves) or MOVES)
+    return policy
+
+def build_payload(ruleset: str, snakes: int, width: int, height: int, turn: int, seed: int = 0) -> dict:
+    """
+    /move request of the first snake alive at the given turn, or at the last turn before the game ended.
+    Every payload is a game of its own, so timing one never depends on what the server kept for another.
+    """
+    rng = random.Random(seed)
+    ids = [f"snake-{i}" for i in range(snakes)]
+    game = simulator.Game(ids, ruleset, width, height, seed, id=f"benchmark-{ruleset}-{snakes}-{width}x{height}-{turn}-{seed}")
+    policies = {id: corpus_policy(rng) for id in ids}
+    latencies = {id: [] for id in ids}
+    while game.state.turn < turn:
+        previous = game.state.copy()
+        game.play_turn(policies, latencies)
+        if game.is_over():
+            game.state = previous
+            break
+    alive = [s.id for s in game.state.snakes if s.alive]
+    return copy.deepcopy(game.request(alive[0]))
+
+def build_corpus(seed: int = 0) -> dict:
+    return {name: build_payload(*spec, seed=seed) for name, *spec in CORPUS}
+
+def benchmarks(data: dict) -> dict:
+    """ Functions to time on a payload, each a callable without arguments """
+    gamemode = data["game"]["ruleset"]["name"]
+    you, snakes = data["you"], data["board"]["snakes"]
+    width, height = data["board"]["width"], data["board"]["height"]
+    food = data["board"]["food"]
+    board = server_logic.create_board(snakes, width, height, gamemode, tails_move=True)
+    cell_moves = board.avoid_blocked(board.generate_possible_moves(board.index(you["head"])))
+    raw = json.dumps(data).encode()
+
+    def dict_moves():
+        return server_logic.generate_possible_moves(you["head"], gamemode, width, height)
+
+    return {
+        "generate_possible_moves": dict_moves,
+        "avoid_walls": lambda: server_logic.avoid_walls(dict_moves(), width, height),
+        "avoid_body": lambda: server_logic.avoid_body(dict_moves(), you["body"]),
+        "avoid_snakes": lambda: server_logic.avoid_snakes(dict_moves(), snakes),
+        "avoid_head_to_head": lambda: server_logic.avoid_head_to_head(dict_moves(), snakes, you["length"], you["id"], gamemode, width, height),
+        "create_board": lambda: server_logic.create_board(snakes, width, height, gamemode, tails_move=True),
+        "board_filters": lambda: board.avoid_head_to_head(board.avoid_blocked(board.generate_possible_moves(board.index(you["head"]))), snakes, you["length"], you["id"]),
+        "get_closer_to_food": lambda: server_logic.get_closer_to_food(cell_moves, food, board),
+        "territory_by_move": lambda: pathfinding.territory_by_move(board, cell_moves, snakes, you["id"]),
+        "score_moves": lambda: evaluation.score_moves(board, cell_moves, snakes, you["id"], food),
+        "parse_move": lambda: parsing.parse_move(raw),
+        "choose_move": lambda: server_logic.choose_move(data, strategy="greedy", endgame_nodes=simulator.ENDGAME_NODES),
+    }
+
+def measure(function, budget: float = 0.05) -> float:
+    """ Best time of one call in microseconds, over REPEATS runs of as many calls as fit in the budget """
+    started, loops = time.perf_counter(), 0
+    while time.perf_counter() - started < budget / REPEATS or loops == 0:
+        function()
+        loops += 1
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        best = min(best, (time.perf_counter() - started) / loops)
+    return best * 1e6
+
+def run(seed: int = 0, budget: float = 0.05) -> dict:
+    """ {payload: {function: microseconds}} """
+    random.seed(seed)
+    return {name: {function: measure(f, budget) for function, f in benchmarks(data).items()}
+            for name, data in build_corpus(seed).items()}
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """ (payload, function, baseline, current) of every function slower than the baseline by more than threshold """
+    regressions = []
+    for name, functions in results.items():
+        for function, current in functions.items():
+            previous = baseline.get(name, {}).get(function)
+            if previous and current > previous * (1 + threshold) and current - previous > MIN_DIFFERENCE_US:
+                regressions.append((name, function, previous, current))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the move logic")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds spent timing each function")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(args.seed, args.budget)
+    for name, functions in results.items():
+        print(name)
+        for function, micros in functions.items():
+            print(f"    {function:<24} {micros:10.1f} us")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, function, previous, current in regressions:
+            print(f"REGRESSION {name} {function}: {previous:.1f} us -> {current:.1f} us")
+        if regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+MOVES = ("up", "down", "left", "right")
+DELTAS = ((0, 1), (0, -1), (-1, 0), (1, 0))
+
+OUTSIDE = -1
+FREE, BLOCKED = 0, 1
+
+_neighbours_cache = {}
+
+def get_neighbours(width: int, height: int, gamemode: str) -> tuple:
+    """ Precomputes the cell reached by each move and the list of valid neighbours of every cell """
+    wrapped = gamemode == "wrapped"
+    key = (width, height, wrapped)
+    if key in _neighbours_cache: return _neighbours_cache[key]
+
+    moves, adjacent = [], []
+    for cell in range(width * height):
+        x, y = cell % width, cell // width
+        targets = []
+        for dx, dy in DELTAS:
+            nx, ny = x + dx, y + dy
+            if wrapped:
+                nx, ny = nx % width, ny % height
+            elif not (0 <= nx < width and 0 <= ny < height):
+                targets.append(OUTSIDE)
+                continue
+            targets.append(ny * width + nx)
+        moves.append(tuple(targets))
+        adjacent.append(tuple(t for t in targets if t != OUTSIDE))
+
+    _neighbours_cache[key] = (tuple(moves), tuple(adjacent))
+    return _neighbours_cache[key]
+
+class Board:
+    """ Flat board where the cell at (x, y) is stored at index y * width + x """
+    __slots__ = ("width", "height", "gamemode", "size", "moves", "adjacent", "cells")
+
+    def __init__(self, width: int, height: int, gamemode: str = "standard"):
+        self.width, self.height, self.gamemode = width, height, gamemode
+        self.size = width * height
+        self.moves, self.adjacent = get_neighbours(width, height, gamemode)
+        self.cells = bytearray(self.size)
+
+    @classmethod
+    def from_data(cls, data: dict) -> "Board":
+        """ Builds the board of a move request """
+        board = data["board"]
+        return cls.from_snakes(board["snakes"], board["width"], board["height"], data["game"]["ruleset"]["name"], tails_move=True)
+
+    @classmethod
+    def from_snakes(cls, snakes: list, width: int, height: int, gamemode: str = "standard", tails_move: bool = False) -> "Board":
+        """
+        Builds a board where every snake segment is blocked.
+        With tails_move, tails that will be vacated this turn (the snake did not just eat) are left free.
+        """
+        board = cls(width, height, gamemode)
+        cells = board.cells
+        for snake in snakes:
+            body = snake["body"]
+            for segment in body:
+                cells[segment["y"] * width + segment["x"]] = BLOCKED
+            if tails_move and len(body) > 1 and body[-1] != body[-2]:
+                cells[body[-1]["y"] * width + body[-1]["x"]] = FREE
+        return board
+
+    def index(self, coordinates: dict) -> int:
+        """ Converts x/y coordinates to a cell index """
+        return coordinates["y"] * self.width + coordinates["x"]
+
+    def coordinates(self, cell: int) -> dict:
+        """ Converts a cell index to x/y coordinates """
+        return {"x": cell % self.width, "y": cell // self.width}
+
+    def is_free(self, cell: int) -> bool:
+        return cell != OUTSIDE and not self.cells[cell]
+
+    def generate_possible_moves(self, head: int) -> dict:
+        """ Calculates the cell reached by each of the possible moves (OUTSIDE if it leaves the board) """
+        return dict(zip(MOVES, self.moves[head]))
+
+    def avoid_walls(self, possible_moves: dict) -> dict:
+        """ Removes the moves that leave the board """
+        return {move: cell for move, cell in possible_moves.items() if cell != OUTSIDE}
+
+    def avoid_blocked(self, possible_moves: dict) -> dict:
+        """ Removes the moves that leave the board or collide with any snake """
+        cells = self.cells
+        return {move: cell for move, cell in possible_moves.items() if cell != OUTSIDE and not cells[cell]}
+
+    def avoid_head_to_head(self, possible_moves: dict, snakes: list, length: int, id: str, unlikely: dict = None) -> dict:
+        """
+        Removes the moves that may collide head to head with snakes at least as long.
+        unlikely gives, by snake id, the cells that snake is not expected to move to (see opponents.py).
+        """
+        danger = set()
+        for snake in snakes:
+            if snake["id"] == id or snake["length"] < length: continue
+            ignored = unlikely.get(snake["id"], ()) if unlikely else ()
+            danger.update(cell for cell in self.adjacent[self.index(snake["head"])] if cell not in ignored)
+        return {move: cell for move, cell in possible_moves.items() if cell not in danger}
+
+    def __str__(self) -> str:
+        rows = []
+        for y in range(self.height - 1, -1, -1):
+            row = self.cells[y * self.width:(y + 1) * self.width]
+            rows.append(''.join("0" if c else "1" for c in row))
+        return "\n".join(rows)
@@ -0,0 +1,166 @@
+"""
+Exact space filling once our snake is sealed off from every opponent.
+
+Nothing but the length of the path matters then, so the region is searched for the longest path
+our head can follow through it. The cells are the bits of an integer: the search goes depth first
+over (cell, visited cells) states, memoised as the same cells are often visited in several orders,
+and cut by a bound on what is left: the cells still reachable, of which a path can only finish in
+one dead end and must alternate the colours of a checkerboard. Body cells are entered
+from the turn they are vacated, our own a turn later for every food eaten on the way.
+"""
+import time
+
+from board import Board
+from pathfinding import UNREACHABLE, TimeMap, bfs, timed_bfs
+
+# Nodes searched between two looks at the clock, a few milliseconds on an open 11x11 region
+CHECK_EVERY = 64
+
+class SearchStopped(Exception):
+    pass
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+def isolated_region(board: Board, possible_moves: dict, snakes: list, id: str, timing: TimeMap) -> list:
+    """
+    Cells our snake can reach, over time, that no opponent can reach now, or None when an opponent
+    can reach the cells we can reach now (or there is no opponent to be sealed off from).
+    Bodies between us and the opponents move away eventually, they are taken to last long enough.
+    """
+    heads = {snake["id"]: board.index(snake["head"]) for snake in snakes if snake["id"] != id}
+    if not heads or not possible_moves: return None
+    theirs, now = bfs(board, heads).distances, bfs(board, possible_moves).distances
+    if any(now[cell] != UNREACHABLE and theirs[cell] != UNREACHABLE for cell in range(board.size)): return None
+    ours = timed_bfs(board, possible_moves, timing, start=1).distances
+    return [cell for cell in range(board.size) if ours[cell] != UNREACHABLE and theirs[cell] == UNREACHABLE]
+
+class Fill:
+    """ First move of the longest path found, its length and whether no path is known to go further """
+    __slots__ = ("move", "length", "complete")
+
+    def __init__(self, move: str, length: int, complete: bool):
+        self.move, self.length, self.complete = move, length, complete
+
+class SpaceFiller:
+    """
+    Longest path from the head through a region, searched until the deadline, or until max_nodes
+    nodes when given so the move does not depend on the speed of the machine (e.g. in simulations)
+    """
+
+    def __init__(self, board: Board, head: int, region: list, timing: TimeMap, deadline: float, limit: int = None, max_nodes: int = None):
+        self.board, self.head, self.deadline, self.max_nodes = board, head, deadline, max_nodes
+        self.opens = [timing.times[cell] if board.cells[cell] else 0 for cell in range(board.size)]
+        self.own = timing.own
+        # The path never comes back to the head, even once its cell was vacated
+        self.region = sum(1 << cell for cell in region if cell != head)
+        self.food = sum(1 << cell for cell in region if timing.food[cell])
+        self.memo = {}
+        self.nodes = 0
+        self.best, self.best_move, self.move = 0, None, None
+
+        width, height = board.width, board.height
+        self.width, self.full = width, (1 << board.size) - 1
+        first = sum(1 << (y * width) for y in range(height))
+        self.first_column, self.last_column = first, first << (width - 1)
+        self.wrapped = board.gamemode == "wrapped"
+        # A path alternates between the two colours of a checkerboard, unless wrapping joins two cells of the same colour
+        self.parity = not self.wrapped or (width % 2 == 0 and height % 2 == 0)
+        self.black = sum(1 << cell for cell in range(board.size) if (cell % width + cell // width) % 2 == 0)
+        # A path as long as the limit (the health of the snake) is as good as any longer one
+        self.target = self.bound(head, 0) if limit is None else min(limit, self.bound(head, 0))
+
+    def shifts(self, mask: int) -> tuple:
+        """ The mask moved one cell right, left, up and down """
+        width, full = self.width, self.full
+        right, left = (mask & ~self.last_column) << 1, (mask & ~self.first_column) >> 1
+        up, down = (mask << width) & full, mask >> width
+        if self.wrapped:
+            rows = self.board.size - width
+            right |= (mask & self.last_column) >> (width - 1)
+            left |= (mask & self.first_column) << (width - 1)
+            up |= mask >> rows
+            down |= (mask << rows) & full
+        return right, left, up, down
+
+    def bound(self, cell: int, visited: int) -> int:
+        """
+        Most cells a path can still enter after cell: those it can reach, matched by colour,
+        and of the dead ends among them only the one the path finishes in.
+        """
+        start, free = 1 << cell, self.region & ~visited
+        reached = start
+        while True:
+            right, left, up, down = self.shifts(reached)
+            grown = (right | left | up | down) & free | start
+            if grown == reached: break
+            reached = grown
+        right, left, up, down = self.shifts(reached)
+        reached &= ~start
+        count = popcount(reached)
+        several = (right & left) | (right & up) | (right & down) | (left & up) | (left & down) | (up & down)
+        dead_ends = popcount(reached & ~several)
+        bound = count - max(0, dead_ends - 1)
+        if not self.parity: return bound
+        same = popcount(reached & self.black) if start & self.black else popcount(reached & ~self.black)
+        other = count - same
+        return min(bound, 2 * min(same, other) + (other > same))
+
+    def options(self, cell: int, visited: int) -> list:
+        """ Cells the path can enter next, those with the fewest ways on first """
+        depth = popcount(visited) + 1
+        eaten = popcount(visited & self.food)
+        region, opens, own = self.region, self.opens, self.own
+        adjacent = self.board.adjacent
+        options = []
+        for neighbour in adjacent[cell]:
+            bit = 1 << neighbour
+            if not region & bit or visited & bit: continue
+            if opens[neighbour] and opens[neighbour] + (eaten if own[neighbour] else 0) > depth: continue
+            ways = sum(1 for n in adjacent[neighbour] if region >> n & 1 and not visited >> n & 1)
+            options.append((ways, neighbour))
+        return [neighbour for _, neighbour in sorted(options)]
+
+    def longest(self, cell: int, visited: int) -> tuple:
+        """ (most cells the path can still enter after cell, whether that is exact or cut by the best path so far) """
+        key = (cell, visited)
+        if key in self.memo: return self.memo[key], True
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes >= self.max_nodes: raise SearchStopped()
+        if self.nodes % CHECK_EVERY == 0 and time.perf_counter() > self.deadline: raise SearchStopped()
+
+        depth, bound = popcount(visited), self.bound(cell, visited)
+        if depth + bound <= self.best: return 0, False
+        best, exact = 0, True
+        for neighbour in self.options(cell, visited):
+            value, child_exact = self.longest(neighbour, visited | 1 << neighbour)
+            exact = exact and child_exact
+            best = max(best, 1 + value)
+            if depth + best > self.best:
+                self.best, self.best_move = depth + best, self.move
+                if self.best >= self.target: raise SearchStopped()
+            # No other way on can go further
+            if best == bound: break
+
+        if exact: self.memo[key] = best
+        return best, exact
+
+    def run(self, possible_moves: dict) -> Fill:
+        """ Searches from every candidate move, until the longest path is known or the deadline """
+        cells = {cell: move for move, cell in possible_moves.items()}
+        try:
+            for cell in self.options(self.head, 0):
+                if cell not in cells: continue
+                self.move = cells[cell]
+                if self.best_move is None: self.best, self.best_move = 1, self.move
+                self.longest(cell, 1 << cell)
+            complete = True
+        except SearchStopped:
+            complete = self.best >= self.target
+        return Fill(self.best_move, self.best, complete)
+
+def solve(board: Board, possible_moves: dict, region: list, timing: TimeMap, head: int, deadline: float, limit: int = None,
+          max_nodes: int = None) -> Fill:
+    """ Longest path through an isolated region, up to limit cells, or None when no move enters it """
+    fill = SpaceFiller(board, head, region, timing, deadline, limit, max_nodes).run(possible_moves)
+    return fill if fill.move is not None else None
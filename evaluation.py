@@ -0,0 +1,182 @@
+"""
+Batched evaluation of candidate moves and simulated states.
+
+With EVALUATOR=numpy and NumPy installed, the board is a set of arrays (free cells, owners,
+frontiers) and the breadth first searches of a whole batch run together, one array operation
+per distance. Otherwise the pure Python searches of pathfinding.py are used; both give the
+same results. Searching by whole distances costs the arrays a pass over every cell per
+distance, so they only pay off on large batches of small boards, hence the opt-in.
+"""
+import os
+
+from board import Board, BLOCKED
+from pathfinding import UNREACHABLE, TimeMap, bfs, voronoi
+import pathfinding
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ENABLED = numpy is not None and os.environ.get("EVALUATOR", "python") == "numpy"
+# Cells times batch size below which the Python loops are used anyway
+NUMPY_MIN_CELLS = 2000
+
+def use_numpy(board: Board, batch: int) -> bool:
+    return ENABLED and board.size * batch >= NUMPY_MIN_CELLS
+
+def neighbours(values, board: Board) -> list:
+    """
+    Values of the four neighbours of every cell, for arrays of any leading shape over the cells,
+    as shifted copies of the grid; cells past the edge of the board read as -1 (False for a mask).
+    """
+    grid = values.reshape(values.shape[:-1] + (board.height, board.width))
+    if board.gamemode == "wrapped":
+        shifted = [numpy.roll(grid, shift, axis) for axis in (-1, -2) for shift in (1, -1)]
+    else:
+        fill = False if values.dtype == bool else -1
+        shifted = [numpy.full_like(grid, fill) for _ in range(4)]
+        shifted[0][..., 1:] = grid[..., :-1]
+        shifted[1][..., :-1] = grid[..., 1:]
+        shifted[2][..., 1:, :] = grid[..., :-1, :]
+        shifted[3][..., :-1, :] = grid[..., 1:, :]
+    return [s.reshape(values.shape) for s in shifted]
+
+def expand(frontier, board: Board):
+    """ Cells next to the frontier """
+    return numpy.logical_or.reduce(neighbours(frontier, board))
+
+def distances_batch(board: Board, free, starts: list):
+    """
+    Distances from every start cell, one row per start, over the free cells of its row of free (batch, size).
+    Start cells are at distance 0 whether they are free or not.
+    """
+    rows = numpy.arange(len(starts))
+    distances = numpy.full((len(starts), board.size), UNREACHABLE, dtype=numpy.int32)
+    frontier = numpy.zeros((len(starts), board.size), dtype=bool)
+    frontier[rows, starts] = True
+    distance = 0
+    while frontier.any():
+        distances[frontier] = distance
+        frontier = expand(frontier, board) & free & (distances == UNREACHABLE)
+        distance += 1
+    return distances
+
+def voronoi_batch(board: Board, cells: list, batch: list, timing: TimeMap = None) -> list:
+    """
+    voronoi() of several scenarios at once: batch is a list of sources lists and cells the
+    occupancy of every scenario (a single bytearray when they all share the board's).
+    """
+    if not batch: return []
+    if not use_numpy(board, len(batch)):
+        scenario = Board(board.width, board.height, board.gamemode)
+        results = []
+        for i, sources in enumerate(batch):
+            scenario.cells = cells if isinstance(cells, (bytes, bytearray)) else cells[i]
+            results.append(voronoi(scenario, sources, timing))
+        return results
+
+    size = board.size
+    count, width = len(batch), max(len(sources) for sources in batch)
+    if isinstance(cells, (bytes, bytearray)):
+        free = numpy.frombuffer(bytes(cells), dtype=numpy.uint8)[None, :] != BLOCKED
+    else:
+        free = numpy.array([numpy.frombuffer(bytes(c), dtype=numpy.uint8) for c in cells]) != BLOCKED
+    times = numpy.array(timing.times, dtype=numpy.int32)[None, :] if timing is not None else None
+
+    lengths = numpy.zeros((count, width), dtype=numpy.int32)
+    seeds = {}
+    for row, sources in enumerate(batch):
+        for owner, (cell, length, distance) in enumerate(sources):
+            lengths[row, owner] = length
+            seeds.setdefault(distance, []).append((row, owner, cell))
+    last_seed = max(seeds)
+
+    # Owner and length of the frontier cells, -1 everywhere else
+    owner = numpy.full((count, size), -1, dtype=numpy.int32)
+    length = numpy.full((count, size), -1, dtype=numpy.int32)
+    reached = numpy.zeros((count, size), dtype=bool)
+    offsets = (numpy.arange(count) * width)[:, None]
+    counts = numpy.zeros(count * width, dtype=numpy.int64)
+    distance = 0
+    while distance <= last_seed or (length >= 0).any():
+        # Claims on every free cell from its four neighbours, and from the sources starting at this distance
+        claims = list(zip(neighbours(owner, board), neighbours(length, board)))
+        closed = reached | (~free if times is None else ~free & (times > distance))
+        for _, l in claims: l[closed] = -1
+        if distance in seeds:
+            seeded = (numpy.full((count, size), -1, dtype=numpy.int32), numpy.full((count, size), -1, dtype=numpy.int32))
+            for row, source, cell in seeds[distance]:
+                if not reached[row, cell]: seeded[0][row, cell], seeded[1][row, cell] = source, lengths[row, source]
+            claims.append(seeded)
+
+        # Cells reached at the same time go to the longest source, or to nobody when two sources tie
+        longest = numpy.maximum.reduce([l for _, l in claims])
+        claimed = longest >= 0
+        high = numpy.maximum.reduce([numpy.where(l == longest, o, -1) for o, l in claims])
+        low = numpy.minimum.reduce([numpy.where(l == longest, o, width) for o, l in claims])
+        reached |= claimed
+        owner = numpy.where(claimed & (high == low), high, -1)
+        length = numpy.where(owner >= 0, longest, -1)
+        counts += numpy.bincount((owner + offsets)[owner >= 0], minlength=count * width)
+        distance += 1
+
+    counts = counts.reshape(count, width)
+    return [counts[row, :len(sources)].tolist() for row, sources in enumerate(batch)]
+
+def territory_by_move(board: Board, possible_moves: dict, snakes: list, id: str, timing: TimeMap = None) -> dict:
+    """ pathfinding.territory_by_move() with every candidate move searched in one batch """
+    if not use_numpy(board, len(possible_moves)):
+        return pathfinding.territory_by_move(board, possible_moves, snakes, id, timing)
+    my_length = next(snake["length"] for snake in snakes if snake["id"] == id)
+    others = [(board.index(snake["head"]), snake["length"], 0) for snake in snakes if snake["id"] != id]
+    batch = [[(cell, my_length, 1)] + others for cell in possible_moves.values()]
+    return {move: counts[0] for move, counts in zip(possible_moves, voronoi_batch(board, board.cells, batch, timing))}
+
+class MoveScore:
+    """ What a candidate move leads to: reachable area, distance to the closest food and head to head danger """
+    __slots__ = ("area", "food", "danger")
+
+    def __init__(self, area: int, food: int, danger: bool):
+        self.area, self.food, self.danger = area, food, danger
+
+def danger_cells(board: Board, snakes: list, length: int, id: str) -> set:
+    """ Cells where a snake at least as long as ours could move its head next turn """
+    return {cell for snake in snakes if snake["id"] != id and snake["length"] >= length
+            for cell in board.adjacent[board.index(snake["head"])]}
+
+def score_moves(board: Board, possible_moves: dict, snakes: list, id: str, food: list = ()) -> dict:
+    """ MoveScore of every candidate move, food is UNREACHABLE when no food can be reached """
+    length = next(snake["length"] for snake in snakes if snake["id"] == id)
+    danger = danger_cells(board, snakes, length, id)
+    food_cells = [board.index(f) for f in food]
+
+    if not use_numpy(board, len(possible_moves)):
+        scores = {}
+        for move, cell in possible_moves.items():
+            distances = bfs(board, {move: cell})
+            nearest = distances.nearest(food_cells)
+            scores[move] = MoveScore(distances.reachable(), UNREACHABLE if nearest is None else distances.distance(nearest), cell in danger)
+        return scores
+
+    free = numpy.frombuffer(bytes(board.cells), dtype=numpy.uint8)[None, :] != BLOCKED
+    distances = distances_batch(board, free, list(possible_moves.values()))
+    areas = (distances != UNREACHABLE).sum(axis=1)
+    if food_cells:
+        to_food = distances[:, food_cells]
+        nearest = numpy.where(to_food == UNREACHABLE, board.size, to_food).min(axis=1)
+    else:
+        nearest = numpy.full(len(possible_moves), board.size)
+    return {move: MoveScore(int(areas[i]), UNREACHABLE if nearest[i] == board.size else int(nearest[i]), cell in danger)
+            for i, (move, cell) in enumerate(possible_moves.items())}
+
+def territories(states: list, id: str) -> list:
+    """ Voronoi territory of the snake with the given id and of its opponents in many simulated states at once """
+    if not states: return []
+    batch, cells = [], []
+    for state in states:
+        me = state.snake(id)
+        opponents = [s for s in state.snakes if s.alive and s.id != id]
+        batch.append([(me.head, me.length, 0)] + [(s.head, s.length, 0) for s in opponents])
+        cells.append(state.occupancy().cells)
+    return voronoi_batch(states[0].board, cells, batch)
@@ -0,0 +1,167 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+from board import Board
+from opponents import OpponentModel
+from rules import DEFAULT_HAZARD_DAMAGE
+from transposition import TranspositionTable
+
+IDLE_TTL = 120
+# The per-game state is small, the search memory (a transposition table of TABLE_SIZE slots
+# and a MCTS tree) is only kept for the games played most recently
+MAX_GAMES = 4096
+MAX_TABLES = 32
+# Turns over which the network latency is measured, the worst of them is used
+LATENCY_TURNS = 5
+
+class Game:
+    """ Everything kept between the turns of a game, updated incrementally on every /move """
+    __slots__ = ("id", "ruleset", "board", "hazards", "hazard_damage", "costs", "turn", "heads", "model", "table", "tree", "tree_state",
+                 "elapsed", "latencies", "last_seen")
+
+    def __init__(self, data: dict):
+        self.id = data["game"]["id"]
+        self.ruleset = data["game"]["ruleset"]["name"]
+        # Geometry only (neighbour tables are shared by every game with the same board), occupancy is per turn
+        self.board = Board(data["board"]["width"], data["board"]["height"], self.ruleset)
+        self.hazards = frozenset()
+        self.hazard_damage = data["game"]["ruleset"].get("settings", {}).get("hazardDamagePerTurn", DEFAULT_HAZARD_DAMAGE)
+        # Health it costs to enter every cell, patched where the hazards changed
+        self.costs = array('i', [1]) * self.board.size
+        self.turn = -1
+        self.heads = {}
+        self.model = OpponentModel()
+        self.table = None
+        self.tree = self.tree_state = None
+        # How long we took to answer the previous turn, and the network latencies measured so far, in ms
+        self.elapsed = None
+        self.latencies = deque(maxlen=LATENCY_TURNS)
+        self.last_seen = time.monotonic()
+
+    def get_table(self) -> TranspositionTable:
+        if self.table is None: self.table = TranspositionTable(self.board.size)
+        return self.table
+
+    def release(self):
+        """ Drops the search memory, rebuilt when the game is searched again """
+        self.table = None
+        self.tree = self.tree_state = None
+
+    def network_latency(self) -> float:
+        """ Worst round trip time spent outside of our server on the last turns, None until measured """
+        return max(self.latencies) if self.latencies else None
+
+    def fits(self, data: dict) -> bool:
+        """ Whether a request is played on the board of this game """
+        board = data["board"]
+        return (board["width"], board["height"], data["game"]["ruleset"]["name"]) == (self.board.width, self.board.height, self.ruleset)
+
+    def update(self, data: dict, occupancy: Board = None):
+        """
+        Records what changed since the previous turn; a turn seen twice is only recorded once.
+        occupancy is the board of the turn with moving tails, when the caller already built it.
+        """
+        if data.get("turn", 0) <= self.turn: return
+        # Patterns of the previous turn only explain the moves when no turn was missed
+        consecutive = data.get("turn", 0) == self.turn + 1
+        self.turn = data.get("turn", 0)
+
+        # you.latency is the total response time of our previous answer as the engine saw it
+        latency = float(data["you"].get("latency") or 0)
+        if latency > 0 and self.elapsed is not None:
+            self.latencies.append(max(0.0, latency - self.elapsed))
+
+        hazards = data["board"].get("hazards", ())
+        # The costs are only patched, and the layout replaced, on turns when the set of hazard cells changed
+        layout = frozenset(self.board.index(h) for h in hazards)
+        if layout != self.hazards:
+            for cell in layout - self.hazards:
+                self.costs[cell] = 1 + self.hazard_damage
+            for cell in self.hazards - layout:
+                self.costs[cell] = 1
+            self.hazards = layout
+
+        board, heads, played = self.board, {}, {}
+        for snake in data["board"]["snakes"]:
+            head = heads[snake["id"]] = board.index(snake["head"])
+            previous = self.heads.get(snake["id"])
+            if previous is not None and head in board.moves[previous]:
+                played[snake["id"]] = board.moves[previous].index(head)
+        self.heads = heads
+
+        snakes = data["board"]["snakes"]
+        if occupancy is None: occupancy = Board.from_snakes(snakes, board.width, board.height, self.ruleset, tails_move=True)
+        opponents = {s["id"]: [board.index(c) for c in s["body"]] for s in snakes if s["id"] != data["you"]["id"]}
+        food = {board.index(f) for f in data["board"]["food"]}
+        self.model.update(board, occupancy, opponents, food, set(heads.values()), played if consecutive else {})
+
+def key(data: dict) -> tuple:
+    """ Games are kept per snake, as several of our snakes can play the same game """
+    return data["game"]["id"], data["you"]["id"]
+
+class GameStore:
+    """
+    Games by id, dropped on /end, after IDLE_TTL seconds without a request, or past MAX_GAMES.
+    Only the MAX_TABLES games used last keep their search memory.
+    The threads of a server share the store, every access goes through its lock.
+    """
+
+    def __init__(self, ttl: float = IDLE_TTL, max_games: int = MAX_GAMES, max_tables: int = MAX_TABLES):
+        self.ttl, self.max_games, self.max_tables = ttl, max_games, max_tables
+        self.games = OrderedDict()
+        # Keys of the games allowed to hold search memory, least recently used first
+        self.searched = OrderedDict()
+        self.lock = threading.RLock()
+
+    def get(self, data: dict) -> Game:
+        """ Game of a request, created if it was never seen (e.g. the server restarted mid game) """
+        with self.lock:
+            return self._get(data)
+
+    def _get(self, data: dict) -> Game:
+        self.evict()
+        game_key = key(data)
+        game = self.games.get(game_key)
+        # A turn older than the last one seen, or on another board, is a new game played under the same id
+        if game is None or data.get("turn", 0) < game.turn or not game.fits(data):
+            game = self.games[game_key] = Game(data)
+            while len(self.games) > self.max_games:
+                self.drop(next(iter(self.games)))
+        self.games.move_to_end(game_key)
+        self.searched[game_key] = game
+        self.searched.move_to_end(game_key)
+        while len(self.searched) > self.max_tables:
+            self.searched.popitem(last=False)[1].release()
+        game.last_seen = time.monotonic()
+        return game
+
+    def turn(self, data: dict, occupancy: Board = None) -> Game:
+        """ Game of a move request, updated with it (see Game.update for occupancy) """
+        with self.lock:
+            game = self._get(data)
+            game.update(data, occupancy)
+        return game
+
+    def end(self, data: dict):
+        with self.lock:
+            self.drop(key(data))
+
+    def drop(self, game_key: tuple):
+        self.games.pop(game_key, None)
+        self.searched.pop(game_key, None)
+
+    def evict(self, now: float = None):
+        """ Games are ordered by last use, so only the front needs checking """
+        if now is None: now = time.monotonic()
+        with self.lock:
+            while self.games:
+                game = next(iter(self.games.values()))
+                if now - game.last_seen < self.ttl: break
+                self.drop(next(iter(self.games)))
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+store = GameStore()
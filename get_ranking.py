@@ -1,16 +1,179 @@
-from requests_html import HTMLSession
-from bs4 import BeautifulSoup
+"""
+Updates the ranking table of the README with the places of our snake in every arena.
+
+    python get_ranking.py
+    python get_ranking.py --snake KoalaSnake2 andrefpoliveira --snake OtherSnake otherauthor
+
+Arena pages are fetched concurrently over kept-alive connections, revalidated with their
+ETag against a local cache, and scanned for the ladder rows without building a document tree.
+"""
+import argparse
+import codecs
+import hashlib
+import http.client
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
 
 base_link = "https://play.battlesnake.com"
+SNAKE, AUTHOR = "KoalaSnake2", "andrefpoliveira"
+CACHE_DIR = ".ranking_cache"
+WORKERS = 8
+TIMEOUT = 30
+
+class ArenaListParser(HTMLParser):
+    """ (url, name) of the links of the arena dropdown """
+
+    def __init__(self):
+        super().__init__()
+        self.arenas = []
+        self.depth = 0
+        self.link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "ul" and "arena-dropdown-list" in (attrs.get("class") or "").split():
+            self.depth = 1
+        elif tag == "ul" and self.depth:
+            self.depth += 1
+        elif tag == "a" and self.depth:
+            self.link = [attrs.get("href"), ""]
+
+    def handle_endtag(self, tag):
+        if tag == "ul" and self.depth:
+            self.depth -= 1
+        elif tag == "a" and self.link is not None:
+            self.arenas.append((self.link[0], self.link[1].strip()))
+            self.link = None
+
+    def handle_data(self, data):
+        if self.link is not None: self.link[1] += data
+
+class LadderParser(HTMLParser):
+    """
+    Counts the ladder rows of an arena page and reads the rank of the tracked snakes,
+    given as (name, author) pairs, from their row only.
+    """
+
+    def __init__(self, snakes: list):
+        super().__init__()
+        self.snakes = set(snakes)
+        self.ranks = {}
+        self.rows = 0
+        self.row = None
+        self.rank = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ("tr", "td"): return
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "tr" and "ladder-row" in classes:
+            self.rows += 1
+            snake = (attrs.get("data-snake-name"), attrs.get("data-author-name"))
+            self.row = snake if snake in self.snakes and snake not in self.ranks else None
+        elif tag == "td" and self.row is not None and "arena-leaderboard-rank" in classes:
+            self.rank = ""
+
+    def handle_endtag(self, tag):
+        if tag == "td" and self.rank is not None:
+            self.ranks[self.row] = int(self.rank.strip())
+            self.rank = self.row = None
+        elif tag == "tr":
+            self.row = None
+
+    def handle_data(self, data):
+        if self.rank is not None: self.rank += data
+
+class RankingClient:
+    """ Fetches arena pages concurrently, with one kept-alive connection per thread and an ETag cache """
+
+    def __init__(self, base_url: str = base_link, cache_dir: str = CACHE_DIR, workers: int = WORKERS, timeout: float = TIMEOUT):
+        self.base_url, self.cache_dir = base_url.rstrip("/"), cache_dir
+        self.workers, self.timeout = workers, timeout
+        self.local = threading.local()
+        if cache_dir: os.makedirs(cache_dir, exist_ok=True)
 
-def get_snake_rank(snake_name: str, soup: BeautifulSoup):
-    """ Parses the html page to get the ranking on the category """
+    def connection(self) -> http.client.HTTPConnection:
+        if getattr(self.local, "connection", None) is None:
+            parts = urlsplit(self.base_url)
+            connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            self.local.connection = connection_class(parts.netloc, timeout=self.timeout)
+        return self.local.connection
 
-    snake_row = soup.find_all('tr', {'class': 'ladder-row', 'data-snake-name': snake_name, 'data-author-name': 'andrefpoliveira'})
-    if len(snake_row) == 0: return None
+    def cache_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(path.encode()).hexdigest() + ".json")
 
-    ranking = int(snake_row[0].find_all('td', {'class': 'arena-leaderboard-rank'})[0].text.strip())
-    return ranking
+    def request(self, path: str, headers: dict) -> http.client.HTTPResponse:
+        """ GET over the connection of the thread, opened again once if the server closed it """
+        for attempt in (0, 1):
+            connection = self.connection()
+            try:
+                connection.request("GET", path, headers=headers)
+                return connection.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self.local.connection = None
+                if attempt: raise
+
+    def fetch(self, path: str, parser: HTMLParser = None) -> str:
+        """
+        Body of the page, fed to the parser as it arrives. A cached page is revalidated with
+        its ETag and parsed from the cache when the server answers it did not change.
+        """
+        cached = None
+        if self.cache_dir and os.path.exists(self.cache_path(path)):
+            with open(self.cache_path(path)) as f:
+                cached = json.load(f)
+
+        headers = {"User-Agent": "get_ranking"}
+        if cached is not None and cached.get("etag"): headers["If-None-Match"] = cached["etag"]
+        response = self.request(path, headers)
+        if response.status == 304 and cached is not None:
+            response.read()
+            if parser is not None: parser.feed(cached["body"])
+            return cached["body"]
+        if response.status != 200:
+            response.read()
+            raise RuntimeError(f"GET {path}: {response.status} {response.reason}")
+
+        # Chunks can end in the middle of a character
+        decoder, chunks = codecs.getincrementaldecoder("utf-8")(errors="replace"), []
+        while True:
+            chunk = response.read(1 << 16)
+            text = decoder.decode(chunk, final=not chunk)
+            chunks.append(text)
+            if parser is not None: parser.feed(text)
+            if not chunk: break
+        body = "".join(chunks)
+
+        etag = response.getheader("ETag")
+        if self.cache_dir and etag:
+            with open(self.cache_path(path), "w") as f:
+                json.dump({"etag": etag, "body": body}, f)
+        return body
+
+    def arenas(self) -> list:
+        """ (url, name) of every arena """
+        parser = ArenaListParser()
+        self.fetch("/arena/global/", parser)
+        return parser.arenas
+
+    def arena_ranks(self, url: str, snakes: list) -> tuple:
+        """ ({(name, author): rank}, number of players) of an arena """
+        parser = LadderParser(snakes)
+        self.fetch(url, parser)
+        parser.close()
+        return parser.ranks, parser.rows
+
+    def rankings(self, snakes: list) -> dict:
+        """ {arena: ({(name, author): rank}, players)} of every arena, fetched concurrently """
+        arenas = self.arenas()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {arena: pool.submit(self.arena_ranks, url, snakes) for url, arena in arenas}
+            return {arena: future.result() for arena, future in futures.items()}
 
 def get_idx_of_line(lines, match, after_line = 0):
     for idx, line in enumerate(lines):
@@ -24,39 +187,50 @@ def find_current_result(arena: str, results: dict):
             return k, results[k][0], results[k][1]
     return None, None, None
 
-session = HTMLSession()
-r = session.get("https://play.battlesnake.com/arena/global/")
-soup = BeautifulSoup(r.text, features="html.parser")
-
-arenas_ul = soup.find_all('ul', {'class': 'arena-dropdown-list'})[0]
-arenas = [(x["href"], x.text) for x in arenas_ul.find_all('a')]
-
-results = {}
-for url, arena in arenas:
-    r = session.get(base_link + url)
-    soup = BeautifulSoup(r.text, features="html.parser")
-    trs = soup.find_all('tr', {'class': 'ladder-row'})
-    results[arena] = (get_snake_rank("KoalaSnake2", soup), len(trs))
-
-with open("README.md") as f:
-    lines = f.readlines()
-
-ranking_line = get_idx_of_line(lines, "## Ranking (Updated once a day)")
-end_of_table = get_idx_of_line(lines, "", ranking_line)
-for i in range(ranking_line+3, end_of_table):
-    _, arena, previous_rank, best_rank, _, _, _ = lines[i].split("|")
-    arena_name, arena_result, total_players = find_current_result(arena.strip(), results)
-    
-    if arena_name != None:
-        lines[i] = f"| {arena_name} | {arena_result} | {arena_result if arena_result < int(best_rank.strip()) else best_rank.strip()} | {arena_result - int(previous_rank)} | {total_players} |\n"
-        del results[arena_name]
-
-counter = 0
-for k in results:
-    if results[k][0] != None:
-        lines.insert(end_of_table + counter, f"| {k} | {results[k][0]} | {results[k][0]} | 0 | {results[k][1]} |\n")
-        counter += 1
-
-with open("README.md", "w") as f:
-    for l in lines:
-        f.write(l)
+def update_readme(lines: list, results: dict) -> list:
+    """ Ranking table updated with results, {arena: (rank or None, players)} """
+    results = dict(results)
+    ranking_line = get_idx_of_line(lines, "## Ranking (Updated once a day)")
+    end_of_table = get_idx_of_line(lines, "", ranking_line)
+    for i in range(ranking_line+3, end_of_table):
+        _, arena, previous_rank, best_rank, _, _, _ = lines[i].split("|")
+        arena_name, arena_result, total_players = find_current_result(arena.strip(), results)
+
+        if arena_name != None and arena_result != None:
+            lines[i] = f"| {arena_name} | {arena_result} | {arena_result if arena_result < int(best_rank.strip()) else best_rank.strip()} | {arena_result - int(previous_rank)} | {total_players} |\n"
+        if arena_name != None:
+            del results[arena_name]
+
+    counter = 0
+    for k in results:
+        if results[k][0] != None:
+            lines.insert(end_of_table + counter, f"| {k} | {results[k][0]} | {results[k][0]} | 0 | {results[k][1]} |\n")
+            counter += 1
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description="Updates the ranking table of the README")
+    parser.add_argument("--snake", nargs=2, action="append", metavar=("NAME", "AUTHOR"),
+                        help="snake to track, the first one is written to the README")
+    parser.add_argument("--base-url", default=base_link)
+    parser.add_argument("--readme", default="README.md")
+    parser.add_argument("--cache", default=CACHE_DIR, help="directory of the ETag cache, empty to disable it")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    snakes = [tuple(s) for s in args.snake] if args.snake else [(SNAKE, AUTHOR)]
+    rankings = RankingClient(args.base_url, args.cache, args.workers).rankings(snakes)
+    for name, author in snakes:
+        places = ", ".join(f"{arena} {ranks.get((name, author))}/{players}" for arena, (ranks, players) in rankings.items())
+        print(f"{name} ({author}): {places}")
+
+    results = {arena: (ranks.get(snakes[0]), players) for arena, (ranks, players) in rankings.items()}
+    with open(args.readme) as f:
+        lines = f.readlines()
+    lines = update_readme(lines, results)
+    with open(args.readme, "w") as f:
+        for l in lines:
+            f.write(l)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import math
+import random
+import time
+
+from board import MOVES
+from rules import GameState, step
+from search import SearchResult, get_deadline
+
+EXPLORATION = 1.4
+PLAYOUT_TURNS = 20
+PLAYOUTS_PER_LEAF = 4
+
+class Node:
+    """
+    Decoupled UCT node: every alive snake keeps its own visit and value statistics per move,
+    and children are indexed by the joint move of all snakes.
+    """
+    __slots__ = ("options", "visits", "values", "children", "count")
+
+    def __init__(self, state: GameState, restrict: dict = None):
+        occupancy = state.occupancy()
+        self.options = [tuple(state.safe_moves(s, occupancy)) if s.alive else () for s in state.snakes]
+        if restrict:
+            for i, moves in restrict.items(): self.options[i] = tuple(moves)
+        self.visits = [[0] * len(MOVES) for _ in state.snakes]
+        self.values = [[0.0] * len(MOVES) for _ in state.snakes]
+        self.children = {}
+        self.count = 0
+
+    def select(self) -> tuple:
+        """ Each snake independently picks the move with the best upper confidence bound """
+        joint, log_count = [], math.log(self.count + 1)
+        for options, visits, values in zip(self.options, self.visits, self.values):
+            best, best_bound = None, -1.0
+            for move in options:
+                if visits[move] == 0:
+                    best = move
+                    break
+                bound = values[move] / visits[move] + EXPLORATION * math.sqrt(log_count / visits[move])
+                if bound > best_bound: best, best_bound = move, bound
+            joint.append(best)
+        return tuple(joint)
+
+    def update(self, joint: tuple, rewards: list, playouts: int):
+        self.count += playouts
+        for i, move in enumerate(joint):
+            if move is None: continue
+            self.visits[i][move] += playouts
+            self.values[i][move] += rewards[i]
+
+def is_terminal(state: GameState) -> bool:
+    alive = sum(1 for s in state.snakes if s.alive)
+    return alive == 0 or (alive == 1 and len(state.snakes) > 1)
+
+def rewards(state: GameState) -> list:
+    """ 1 for the last snake standing, 0 for the dead and 0.5 for the snakes still fighting """
+    alive = sum(1 for s in state.snakes if s.alive)
+    return [(1.0 if alive == 1 else 0.5) if s.alive else 0.0 for s in state.snakes]
+
+def joint_moves(state: GameState, joint: tuple) -> dict:
+    return {snake.id: move for snake, move in zip(state.snakes, joint) if move is not None}
+
+def playout(state: GameState, turns: int) -> list:
+    """ Random safe moves for every snake until the game ends or the turn limit, in place """
+    for _ in range(turns):
+        if is_terminal(state): break
+        occupancy = state.occupancy()
+        step(state, {s.id: random.choice(state.safe_moves(s, occupancy)) for s in state.snakes if s.alive})
+    return rewards(state)
+
+class MCTS:
+    """ Monte Carlo tree search over simultaneous moves, replaying each iteration into preallocated buffers """
+
+    def __init__(self, state: GameState, id: str, deadline: float, root: Node = None):
+        self.state, self.deadline = state, deadline
+        self.index = next(i for i, s in enumerate(state.snakes) if s.id == id)
+        self.root = root
+        self.playouts = 0
+        # Buffers reused by every iteration instead of copying the state
+        self.path_buffer, self.leaf_buffer = state.copy(), state.copy()
+
+    def iterate(self):
+        state, leaf = self.path_buffer, self.leaf_buffer
+        self.state.copy_into(state)
+
+        node, path = self.root, []
+        while True:
+            joint = node.select()
+            path.append((node, joint))
+            step(state, joint_moves(state, joint))
+            if is_terminal(state): break
+            child = node.children.get(joint)
+            if child is None:
+                node.children[joint] = Node(state)
+                break
+            node = child
+
+        total = [0.0] * len(state.snakes)
+        state.copy_into(leaf)
+        for _ in range(PLAYOUTS_PER_LEAF):
+            leaf.copy_into(state)
+            for i, reward in enumerate(playout(state, PLAYOUT_TURNS)):
+                total[i] += reward
+
+        for node, joint in path:
+            node.update(joint, total, PLAYOUTS_PER_LEAF)
+        self.playouts += PLAYOUTS_PER_LEAF
+        return len(path)
+
+    def run(self, moves: list) -> SearchResult:
+        """ Iterates until the deadline and picks our most visited move """
+        started = time.perf_counter()
+        restrict = [MOVES.index(m) for m in moves]
+        if self.root is None:
+            self.root = Node(self.state, {self.index: restrict})
+        else:
+            self.root.options[self.index] = tuple(restrict)
+        depth = 0
+        while time.perf_counter() < self.deadline:
+            depth = max(depth, self.iterate())
+
+        visits, values = self.root.visits[self.index], self.root.values[self.index]
+        best = max(self.root.options[self.index], key=lambda m: visits[m])
+        score = values[best] / visits[best] if visits[best] else 0
+        return SearchResult(MOVES[best], score, depth, self.playouts, time.perf_counter() - started)
+
+def reuse_tree(root: Node, previous: GameState, state: GameState) -> Node:
+    """ Subtree of the previous turn's tree reached by the moves every snake actually played, if any """
+    if root is None or previous is None or state.turn != previous.turn + 1: return None
+    if [s.id for s in previous.snakes] != [s.id for s in state.snakes]: return None
+
+    board_moves, joint = state.board.moves, []
+    for before, after in zip(previous.snakes, state.snakes):
+        if after.head not in board_moves[before.head]: return None
+        joint.append(board_moves[before.head].index(after.head))
+    return root.children.get(tuple(joint))
+
+def search(data: dict, moves: list, started: float = None, game = None, state: GameState = None) -> SearchResult:
+    """
+    Runs a time budgeted MCTS over the given candidate moves of the request.
+    With the game of the request (see games.py), the subtree of the previous turn is searched further.
+    The state of the request is built from data unless it was already parsed.
+    """
+    if state is None:
+        state = GameState.from_data(data, game.hazards if game is not None else None)
+    if game is None:
+        return MCTS(state, data["you"]["id"], get_deadline(data, started)).run(moves)
+
+    root = reuse_tree(game.tree, game.tree_state, state)
+    searcher = MCTS(state, data["you"]["id"], get_deadline(data, started, game), root)
+    result = searcher.run(moves)
+    game.tree, game.tree_state = searcher.root, state
+    return result
@@ -0,0 +1,110 @@
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+# Collection is off unless METRICS=1, in which case every span costs two perf_counter calls and a lock
+ENABLED = os.environ.get("METRICS", "0") == "1"
+
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+NODE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+MARGIN_BUCKETS = (-0.1, -0.01, 0, 0.01, 0.025, 0.05, 0.1, 0.2, 0.4)
+QUANTILES = (0.5, 0.95, 0.99)
+# Quantiles are computed over the most recent observations only
+WINDOW = 1024
+
+class Histogram:
+    """ Cumulative buckets as Prometheus expects them, plus a window of recent values for quantiles """
+    __slots__ = ("buckets", "counts", "sum", "count", "recent")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum, self.count = 0.0, 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound: self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.recent: return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+class Registry:
+    """ Histograms by metric name and labels, rendered in the Prometheus text format """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def register(self, name: str, help: str, buckets: tuple):
+        self.help[name] = (help, buckets)
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        with self.lock:
+            histogram = self.metrics.get((name, labels))
+            if histogram is None:
+                histogram = self.metrics[name, labels] = Histogram(self.help[name][1])
+            histogram.observe(value)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (help, _) in self.help.items():
+                series = [(labels, h) for (n, labels), h in self.metrics.items() if n == name]
+                if not series: continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, h in series:
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {h.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {h.count}")
+                lines.append(f"# HELP {name}_recent {help}, over the last {WINDOW} observations")
+                lines.append(f"# TYPE {name}_recent summary")
+                for labels, h in series:
+                    for q in QUANTILES:
+                        lines.append(f"{name}_recent{format_labels(labels, quantile=q)} {h.quantile(q)}")
+                    lines.append(f"{name}_recent_sum{format_labels(labels)} {sum(h.recent)}")
+                    lines.append(f"{name}_recent_count{format_labels(labels)} {len(h.recent)}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+registry = Registry()
+registry.register("battlesnake_stage_seconds", "Time spent in each stage of a /move", TIME_BUCKETS)
+registry.register("battlesnake_search_nodes", "Nodes (or playouts) searched per move", NODE_BUCKETS)
+registry.register("battlesnake_deadline_margin_seconds", "Time left before the deadline when the search answered", MARGIN_BUCKETS)
+
+def observe(name: str, value: float, **labels):
+    if ENABLED: registry.observe(name, value, tuple(sorted(labels.items())))
+
+class Span:
+    """ Times a block into battlesnake_stage_seconds """
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe("battlesnake_stage_seconds", time.perf_counter() - self.started, (("stage", self.stage),))
+
+_disabled = contextlib.nullcontext()
+
+def span(stage: str):
+    return Span(stage) if ENABLED else _disabled
@@ -0,0 +1,255 @@
+"""
+Opening book: best moves of the first turns, searched deeply offline and looked up by position.
+
+    python opening_book.py --ruleset duel --turns 2 --depth 6 --output opening_book.bin
+    python opening_book.py --output opening_book.bin --check replays/*.jsonl.gz
+    OPENING_BOOK=opening_book.bin python server.py
+
+The book starts from every opening the official rules can deal: each set of fixed spawn
+positions with each placement of the starting food. --check gives the share of the recorded
+moves of real games (see replay.py) that the book answers.
+
+Positions are reduced by the symmetries of the board before being hashed, so a spawn and its
+mirror images share one entry. The book is a sorted array of (key, move) records that is
+memory-mapped and binary searched, so every server process shares the same pages.
+"""
+import argparse
+import math
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from itertools import combinations, product
+
+from board import Board, MOVES, DELTAS
+from rules import MAX_HEALTH, GameState, Snake, step
+from search import ParanoidSearch
+import simulator
+
+MAGIC = b"SNOB"
+HEADER = struct.Struct("<4sHI")
+RECORD = struct.Struct("<QB")
+
+_cell_maps = {}
+
+def transforms(width: int, height: int) -> list:
+    """ Symmetries of the board as (swap, flip_x, flip_y), x and y are only swapped on square boards """
+    swaps = (False, True) if width == height else (False,)
+    return list(product(swaps, (False, True), (False, True)))
+
+def cell_map(width: int, height: int, transform: tuple) -> tuple:
+    """ Cell each cell is sent to by the transform """
+    key = (width, height, transform)
+    if key not in _cell_maps:
+        swap, flip_x, flip_y = transform
+        cells = []
+        for cell in range(width * height):
+            x, y = cell % width, cell // width
+            if swap: x, y = y, x
+            if flip_x: x = width - 1 - x
+            if flip_y: y = height - 1 - y
+            cells.append(y * width + x)
+        _cell_maps[key] = tuple(cells)
+    return _cell_maps[key]
+
+def transform_move(move: int, transform: tuple) -> int:
+    """ Index in MOVES of the move once transformed """
+    swap, flip_x, flip_y = transform
+    dx, dy = DELTAS[move]
+    if swap: dx, dy = dy, dx
+    if flip_x: dx = -dx
+    if flip_y: dy = -dy
+    return DELTAS.index((dx, dy))
+
+def position_key(state: GameState, id: str, transform: tuple) -> int:
+    """ 64 bit hash of the position seen by the snake with the given id, once transformed """
+    board = state.board
+    cells = cell_map(board.width, board.height, transform)
+    me = state.snake(id)
+    opponents = sorted((tuple(cells[c] for c in s.body), s.health) for s in state.snakes if s.alive and s.id != id)
+    position = (board.gamemode, board.width, board.height, tuple(cells[c] for c in me.body), me.health, opponents,
+                sorted(cells[c] for c in state.food), sorted(cells[c] for c in state.hazards))
+    return int.from_bytes(blake2b(repr(position).encode(), digest_size=8).digest(), "little")
+
+def canonical(state: GameState, id: str) -> tuple:
+    """ (key, transform) of the symmetry of the position with the smallest key """
+    board = state.board
+    return min((position_key(state, id, t), t) for t in transforms(board.width, board.height))
+
+class OpeningBook:
+    """ Memory-mapped book of (key, move) records sorted by key """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_turn, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC: raise ValueError(f"{path} is not an opening book")
+
+    def get(self, key: int) -> int:
+        """ Move index stored for the key, or None """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, move = RECORD.unpack_from(self.map, HEADER.size + middle * RECORD.size)
+            if found == key: return move
+            if found < key: low = middle + 1
+            else: high = middle
+        return None
+
+    def lookup(self, state: GameState, id: str) -> str:
+        """ Book move of the snake with the given id, or None when the position is not in the book """
+        if state.turn > self.max_turn: return None
+        key, transform = canonical(state, id)
+        move = self.get(key)
+        if move is None: return None
+        return next(MOVES[m] for m in range(len(MOVES)) if transform_move(m, transform) == move)
+
+    def __len__(self) -> int:
+        return self.count
+
+def write(path: str, entries: dict, max_turn: int):
+    """ Writes {key: move index} as a book """
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, max_turn, len(entries)))
+        for key in sorted(entries):
+            f.write(RECORD.pack(key, entries[key]))
+
+_books = {}
+
+def get_book() -> OpeningBook:
+    """ Book in OPENING_BOOK, mapped once per process (when it starts, see server.py), or None when there is none """
+    path = os.environ.get("OPENING_BOOK")
+    if not path: return None
+    if path not in _books:
+        if not os.path.exists(path): return None
+        _books[path] = OpeningBook(path)
+    return _books[path]
+
+def lookup(data: dict, state: GameState = None) -> str:
+    """ Book move of a move request, or None """
+    book = get_book()
+    if book is None or data.get("turn", 0) > book.max_turn: return None
+    if state is None: state = GameState.from_data(data)
+    return book.lookup(state, data["you"]["id"])
+
+def spawn_sets(width: int, height: int, count: int) -> list:
+    """ Every set of official fixed spawn cells: corners or sides first, the other group after """
+    groups = [[y * width + x for x, y in points] for points in simulator.start_points(width, height)]
+    spawns = []
+    for first, second in (groups, groups[::-1]):
+        if count <= len(first): spawns.extend(combinations(first, count))
+        else: spawns.extend(tuple(first) + rest for rest in combinations(second, count - len(first)))
+    return spawns
+
+def food_sets(width: int, height: int, heads: tuple) -> list:
+    """ Every starting food the official rules can place for the heads, one distinct cell per snake, and the center """
+    center = simulator.center_cell(width, height)
+    options = [simulator.food_options(width, height, head, set()) for head in heads]
+    if not simulator.places_food_by_snakes(width, height, len(heads)): options = []
+    sets = []
+    for cells in product(*options):
+        if len(set(cells)) < len(cells): continue
+        sets.append(set(cells) | ({center} if center not in heads else set()))
+    return sets
+
+def openings(ruleset: str, snakes: int, width: int, height: int, starts: int) -> list:
+    """
+    First states of every opening the official rules can deal, or of the given number of
+    random spawns on boards where the spawns are not fixed
+    """
+    ids = [f"snake-{i}" for i in range(snakes)]
+    if not simulator.uses_fixed_spawns(width, height, snakes):
+        return [simulator.Game(ids, ruleset, width, height, seed).state for seed in range(starts)]
+    rules = simulator.Ruleset.get(ruleset)
+    board = Board(width, height, rules.gamemode)
+    states = []
+    for heads in spawn_sets(width, height, snakes):
+        food = food_sets(width, height, heads) if rules.minimum_food or rules.food_spawn_chance else [set()]
+        for cells in food:
+            bodies = [Snake(id, [head] * simulator.START_LENGTH, MAX_HEALTH) for id, head in zip(ids, heads)]
+            states.append(GameState(board, bodies, set(cells), frozenset(), rules.hazard_damage, 0))
+    return states
+
+def positions(ruleset: str, snakes: int, width: int, height: int, turns: int, starts: int) -> dict:
+    """
+    {key: (state, id, transform)} of every position reached in the first turns of the openings,
+    every snake playing each of its safe moves.
+    Food spawning is left out: positions where food appeared are simply not in the book.
+    """
+    found, layer = {}, openings(ruleset, snakes, width, height, starts)
+
+    for turn in range(turns + 1):
+        next_layer = []
+        for state in layer:
+            alive = state.alive()
+            new = False
+            for snake in alive:
+                key, transform = canonical(state, snake.id)
+                if key not in found:
+                    found[key] = (state, snake.id, transform)
+                    new = True
+            # Positions already seen from every snake were already expanded
+            if not new or turn == turns or len(alive) < 2: continue
+            occupancy = state.occupancy()
+            options = [state.safe_moves(s, occupancy) for s in alive]
+            for combination in product(*options):
+                next_layer.append(step(state.copy(), {s.id: m for s, m in zip(alive, combination)}))
+        layer = next_layer
+    return found
+
+def best_move(state: GameState, id: str, depth: int) -> int:
+    """ Worker: index of the move found by a search to the given depth, or None when there is no choice """
+    moves = [MOVES[m] for m in state.safe_moves(state.snake(id))]
+    if len(moves) < 2: return None
+    return MOVES.index(ParanoidSearch(state, id, math.inf).run(moves, depth).move)
+
+def build(ruleset: str, snakes: int, width: int, height: int, turns: int, depth: int, starts: int, workers: int = None) -> dict:
+    """ {key: move index} in the canonical orientation of every position with a choice to make """
+    found = positions(ruleset, snakes, width, height, turns, starts)
+    entries = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(best_move, state, id, depth) for key, (state, id, _) in found.items()}
+        for key, future in futures.items():
+            move = future.result()
+            if move is not None: entries[key] = transform_move(move, found[key][2])
+    return entries
+
+def hit_rate(book: OpeningBook, records) -> tuple:
+    """ (moves answered by the book, moves up to its last turn) over recorded requests """
+    hits = lookups = 0
+    for record in records:
+        data = record["data"]
+        if record["kind"] != "move" or data.get("turn", 0) > book.max_turn: continue
+        lookups += 1
+        hits += book.lookup(GameState.from_data(data), data["you"]["id"]) is not None
+    return hits, lookups
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds an opening book with deep offline searches")
+    parser.add_argument("--ruleset", default="duel", choices=("standard", "duel", "wrapped", "constrictor"))
+    parser.add_argument("--snakes", type=int, default=None, help="default: 2 for duels, 4 otherwise")
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--turns", type=int, default=2, help="last turn in the book")
+    parser.add_argument("--depth", type=int, default=6, help="search depth of every position")
+    parser.add_argument("--starts", type=int, default=500, help="random spawns to start from on boards without fixed spawns")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="opening_book.bin")
+    parser.add_argument("--check", nargs="+", metavar="LOG", help="report how many recorded moves the book at --output answers instead")
+    args = parser.parse_args()
+
+    if args.check:
+        # Only needed here, replay.py imports the server logic that imports this module
+        import replay
+        hits, lookups = hit_rate(OpeningBook(args.output), replay.read(args.check))
+        print(f"{hits} of {lookups} recorded moves in the book ({hits / lookups if lookups else 0:.1%})")
+        return
+
+    snakes = args.snakes or (2 if args.ruleset == "duel" else 4)
+    entries = build(args.ruleset, snakes, args.width, args.height, args.turns, args.depth, args.starts, args.workers)
+    write(args.output, entries, args.turns)
+    print(f"{len(entries)} positions written to {args.output}")
+
+if __name__ == "__main__":
+    main()
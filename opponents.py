@@ -0,0 +1,97 @@
+"""
+Model of the moves of every opponent, learnt from the moves it played so far in the game.
+
+A move is counted under the local pattern it was played from: which of the four cells around
+the head were free, which of them lead towards the closest food or next to another head, and
+which way the snake was going. The counts give the probability of every move of the opponent in a new position, used
+to search the likely replies first, to leave out the moves it never plays in a pattern seen
+often, and to ignore the head to head cells it is that unlikely to move to.
+"""
+from board import Board, OUTSIDE
+
+# Pseudo count of every move, so moves never seen keep a small probability
+PRIOR = 0.25
+# A move is left out when less likely than this in a pattern seen at least MIN_OBSERVATIONS times
+PRUNE_PROBABILITY = 0.02
+MIN_OBSERVATIONS = 20
+# Last move of a snake that did not move yet
+NO_MOVE = 4
+
+def pattern(board: Board, occupancy: Board, body: list, food, heads) -> int:
+    """
+    Local pattern of a snake with the given body (cell indices, head first) as a small integer:
+    bits 0-3 free neighbours, bits 4-7 moves towards the closest food, bits 8-10 last move and
+    bits 11-14 moves next to the head of another snake (heads holds the heads of every snake).
+    """
+    head, width = body[0], board.width
+    targets, cells, adjacent = board.moves[head], occupancy.cells, board.adjacent
+    free = contested = 0
+    for move, cell in enumerate(targets):
+        if cell == OUTSIDE: continue
+        if not cells[cell]: free |= 1 << move
+        if any(other != head and other in heads for other in adjacent[cell]): contested |= 1 << move
+
+    towards = 0
+    if food:
+        x, y = head % width, head // width
+        closest = min(food, key=lambda f: abs(f % width - x) + abs(f // width - y))
+        fx, fy = closest % width, closest // width
+        # In the order of MOVES: up, down, left, right
+        towards = (fy > y) | (fy < y) << 1 | (fx < x) << 2 | (fx > x) << 3
+
+    last = NO_MOVE
+    if len(body) > 1 and head in board.moves[body[1]]:
+        last = board.moves[body[1]].index(head)
+    return free | towards << 4 | last << 8 | contested << 11
+
+class OpponentModel:
+    """ Move counts of every opponent by pattern, and the pattern each opponent is in this turn """
+    __slots__ = ("counts", "patterns")
+
+    def __init__(self):
+        self.counts = {}
+        self.patterns = {}
+
+    def update(self, board: Board, occupancy: Board, bodies: dict, food: set, heads: set, played: dict):
+        """
+        Counts the moves played since the previous turn, {id: move index}, under the pattern each
+        opponent was in, then records the pattern of every opponent, {id: body}, on this turn.
+        """
+        for id, move in played.items():
+            previous = self.patterns.get(id)
+            if previous is None: continue
+            counts = self.counts.setdefault(id, {}).setdefault(previous, [0] * 4)
+            counts[move] += 1
+        self.patterns = {id: pattern(board, occupancy, body, food, heads) for id, body in bodies.items()}
+
+    def probabilities(self, id: str, key: int, moves: list) -> dict:
+        """ {move: probability} of the given moves of an opponent in a pattern """
+        counts = self.counts.get(id, {}).get(key)
+        if counts is None: return {move: 1 / len(moves) for move in moves}
+        total = sum(counts[move] for move in moves) + PRIOR * len(moves)
+        return {move: (counts[move] + PRIOR) / total for move in moves}
+
+    def unlikely(self, id: str, key: int, moves: list) -> list:
+        """ Moves an opponent is not expected to play in a pattern it was seen in often enough """
+        counts = self.counts.get(id, {}).get(key)
+        if counts is None or sum(counts) < MIN_OBSERVATIONS: return []
+        probabilities = self.probabilities(id, key, moves)
+        return [move for move in moves if probabilities[move] < PRUNE_PROBABILITY]
+
+    def order(self, id: str, key: int, moves: list) -> list:
+        """ Moves of an opponent, the most likely first and the unlikely ones left out (unless all of them are) """
+        if id not in self.counts: return moves
+        unlikely = self.unlikely(id, key, moves)
+        likely = [move for move in moves if move not in unlikely] or moves
+        probabilities = self.probabilities(id, key, likely)
+        return sorted(likely, key=lambda move: -probabilities[move])
+
+    def unlikely_cells(self, board: Board, heads: dict) -> dict:
+        """ {id: cells} next to every opponent, {id: head}, that it is not expected to move to this turn """
+        cells = {}
+        for id, head in heads.items():
+            key = self.patterns.get(id)
+            if key is None: continue
+            free = [move for move in range(4) if key >> move & 1]
+            cells[id] = {board.moves[head][move] for move in self.unlikely(id, key, free)}
+        return cells
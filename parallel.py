@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from board import MOVES
+from opponents import OpponentModel
+from rules import GameState
+from search import ParanoidSearch, SearchResult, get_deadline
+import games
+import mcts
+
+# Time kept by the parent process to collect and combine the answers of the workers
+COMBINE_MARGIN_MS = 20
+
+_pool = None
+_workers = 0
+# Futures submitted to the pool, to cancel those still queued on Python 3.8 (see stop_pool)
+_submitted = weakref.WeakSet()
+
+def _warm(delay: float) -> int:
+    """ Keeps a worker busy for a moment so that every worker of the pool gets started """
+    time.sleep(delay)
+    return os.getpid()
+
+def _init_worker(tables: int):
+    """ The workers share the memory budget of the tables, the parent keeps none while they search """
+    games.store.max_tables = tables
+
+def start_pool(workers: int = None):
+    """ Starts the worker processes once, at boot, so no request pays for their startup """
+    global _pool, _workers
+    if _pool is not None: return
+    _workers = workers or os.cpu_count() or 1
+    _pool = ProcessPoolExecutor(max_workers=_workers, initializer=_init_worker, initargs=(max(1, games.MAX_TABLES // _workers),))
+    wait([_pool.submit(_warm, 0.05) for _ in range(_workers)])
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        if sys.version_info >= (3, 9):
+            _pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in list(_submitted): future.cancel()
+            _pool.shutdown(wait=False)
+        _pool = None
+
+def _submit(function, *args):
+    future = _pool.submit(function, *args)
+    _submitted.add(future)
+    return future
+
+def is_running() -> bool:
+    return _pool is not None
+
+def _local_deadline(deadline: float) -> float:
+    """ Converts a wall clock deadline to this process' perf_counter, which is not shared between processes """
+    return time.perf_counter() + deadline - time.time()
+
+def _search_move(data: dict, move: str, deadline: float, hazards: frozenset, model: OpponentModel) -> tuple:
+    """
+    Worker: scores a single root move at every depth it completes. The hazards and opponent model
+    are those of the parent, which sees every turn; the worker only keeps its tables between turns.
+    """
+    game = games.store.get(data)
+    state = GameState.from_data(data, hazards)
+    table = game.get_table()
+    table.new_search()
+    searcher = ParanoidSearch(state, data["you"]["id"], _local_deadline(deadline), table, model)
+    searcher.run([move])
+    return move, ([scores[move] for scores in searcher.history], searcher.nodes)
+
+def _mcts_visits(data: dict, moves: list, deadline: float) -> tuple:
+    """ Worker: runs an independent tree and returns the root visits of our moves """
+    state = GameState.from_data(data)
+    tree = mcts.MCTS(state, data["you"]["id"], _local_deadline(deadline))
+    tree.run(moves)
+    visits = tree.root.visits[tree.index]
+    return {move: visits[MOVES.index(move)] for move in moves}, tree.playouts
+
+def _collect(futures: list, deadline: float) -> list:
+    """ Results of the workers that answered before the deadline, the others are ignored """
+    done, _ = wait(futures, timeout=max(0, deadline - time.time()))
+    return [f.result() for f in done if f.exception() is None]
+
+def search(data: dict, moves: list, started: float = None, game = None) -> SearchResult:
+    """ Root parallel paranoid search: each root move is searched by its own worker """
+    clock = time.perf_counter()
+    deadline = time.time() + get_deadline(data, started, game) - clock
+    worker_deadline = deadline - COMBINE_MARGIN_MS / 1000
+    hazards, model = (game.hazards, game.model) if game is not None else (None, None)
+    futures = [_submit(_search_move, data, move, worker_deadline, hazards, model) for move in moves]
+    answered = dict(_collect(futures, deadline))
+
+    # Scores are only comparable at the same depth: use the deepest one every answering worker completed
+    depths = [len(history) for history, _ in answered.values()]
+    nodes = sum(n for _, n in answered.values())
+    if not depths or min(depths) == 0:
+        return SearchResult(moves[0], 0, 0, nodes, time.perf_counter() - clock)
+    depth = min(depths)
+    move = max(answered, key=lambda m: answered[m][0][depth - 1])
+    return SearchResult(move, answered[move][0][depth - 1], depth, nodes, time.perf_counter() - clock)
+
+def search_mcts(data: dict, moves: list, started: float = None, game = None) -> SearchResult:
+    """ Root parallel MCTS: every worker grows its own tree and the root visits are summed """
+    clock = time.perf_counter()
+    deadline = time.time() + get_deadline(data, started, game) - clock
+    worker_deadline = deadline - COMBINE_MARGIN_MS / 1000
+    futures = [_submit(_mcts_visits, data, moves, worker_deadline) for _ in range(_workers)]
+
+    visits, playouts = dict.fromkeys(moves, 0), 0
+    for tree_visits, tree_playouts in _collect(futures, deadline):
+        playouts += tree_playouts
+        for move, count in tree_visits.items():
+            visits[move] += count
+    move = max(moves, key=lambda m: visits[m])
+    return SearchResult(move, visits[move] / max(1, sum(visits.values())), 1, playouts, time.perf_counter() - clock)
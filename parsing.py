@@ -0,0 +1,76 @@
+import json
+import time
+
+from rules import GameState
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+SNAKE_FIELDS = ("id", "health", "body", "head", "length")
+
+class ParseStats:
+    """ How much of the turn budget goes into decoding requests """
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+stats = ParseStats()
+
+class ParsedMove:
+    """ A decoded /move request: the fields the logic uses, its compact state and how long parsing took """
+    __slots__ = ("data", "state", "elapsed")
+
+    def __init__(self, data: dict, state: GameState, elapsed: float):
+        self.data, self.state, self.elapsed = data, state, elapsed
+
+def lean_snake(snake: dict) -> dict:
+    return {field: snake[field] for field in SNAKE_FIELDS}
+
+def lean(data: dict) -> dict:
+    """ Drops the fields the logic never reads (names, customizations, shouts, latencies of other snakes...) """
+    game, board, you = data["game"], data["board"], data["you"]
+    ruleset = game["ruleset"]
+    lean_you = lean_snake(you)
+    lean_you["latency"] = you.get("latency", "0")
+    return {
+        "game": {
+            "id": game["id"],
+            "ruleset": {"name": ruleset["name"], "settings": ruleset.get("settings", {})},
+            "timeout": game.get("timeout", 500)
+        },
+        "turn": data.get("turn", 0),
+        "board": {
+            "width": board["width"], "height": board["height"],
+            "food": board["food"], "hazards": board.get("hazards", []),
+            "snakes": [lean_you if s["id"] == you["id"] else lean_snake(s) for s in board["snakes"]]
+        },
+        "you": lean_you
+    }
+
+def parse_move(raw: bytes) -> ParsedMove:
+    """
+    Decodes a /move body once, straight into the lean request and its compact state.
+    Raises ValueError when the body is not a move request.
+    """
+    started = time.perf_counter()
+    try:
+        data = lean(loads(raw))
+        state = GameState.from_data(data)
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError(f"malformed move request: {error!r}") from error
+    elapsed = time.perf_counter() - started
+    stats.add(elapsed)
+    return ParsedMove(data, state, elapsed)
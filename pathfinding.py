@@ -0,0 +1,260 @@
+import heapq
+from array import array
+from collections import deque
+
+from board import Board
+from rules import GameState
+
+UNREACHABLE = -1
+NO_ORIGIN = 255
+NOT_SPENT = 2 ** 31 - 1
+
+class DistanceMap:
+    """ Result of a breadth first search: distance to every reached cell and the source it was reached from """
+    __slots__ = ("board", "labels", "distances", "origins", "found")
+
+    def __init__(self, board: Board, labels: list):
+        self.board, self.labels = board, labels
+        self.distances = array('i', [UNREACHABLE]) * board.size
+        self.origins = bytearray([NO_ORIGIN]) * board.size
+        self.found = None
+
+    def distance(self, cell: int) -> int:
+        return self.distances[cell]
+
+    def origin(self, cell: int):
+        """ Label of the source the cell was first reached from """
+        origin = self.origins[cell]
+        return None if origin == NO_ORIGIN else self.labels[origin]
+
+    def nearest(self, cells) -> int:
+        """ Closest reached cell among the given ones (None if none was reached) """
+        distances, best = self.distances, None
+        for cell in cells:
+            if distances[cell] != UNREACHABLE and (best is None or distances[cell] < distances[best]):
+                best = cell
+        return best
+
+    def reachable(self) -> int:
+        """ Number of reached cells """
+        return self.board.size - self.distances.count(UNREACHABLE)
+
+def target_mask(board: Board, coordinates: list) -> bytearray:
+    """ Bitmap of the given x/y coordinates """
+    mask = bytearray(board.size)
+    for c in coordinates:
+        mask[board.index(c)] = 1
+    return mask
+
+def bfs(board: Board, sources: dict, targets: bytearray = None) -> DistanceMap:
+    """
+    Breadth first search over the free cells, starting at distance 0 from every source cell.
+    sources maps a label (e.g. a move) to its cell; when a targets bitmap is given the search
+    stops at the first target reached, which is stored in DistanceMap.found.
+    """
+    labels = list(sources)
+    result = DistanceMap(board, labels)
+    distances, origins = result.distances, result.origins
+    cells, adjacent = board.cells, board.adjacent
+
+    frontier = deque()
+    for origin, label in enumerate(labels):
+        cell = sources[label]
+        if distances[cell] != UNREACHABLE: continue
+        distances[cell], origins[cell] = 0, origin
+        frontier.append(cell)
+
+    while frontier:
+        current = frontier.popleft()
+        if targets is not None and targets[current]:
+            result.found = current
+            return result
+        distance, origin = distances[current] + 1, origins[current]
+        for neighbour in adjacent[current]:
+            if not cells[neighbour] and distances[neighbour] == UNREACHABLE:
+                distances[neighbour], origins[neighbour] = distance, origin
+                frontier.append(neighbour)
+
+    return result
+
+class TimeMap:
+    """
+    Turn from which every cell can be entered, as the bodies lying on it move away: the segment
+    at index i of a snake of length n is gone after n - i turns. A snake next to food may eat and
+    keep its tail one more turn. Our own body is marked too, as every food we eat on the way delays it.
+    """
+    __slots__ = ("times", "own", "food")
+
+    def __init__(self, size: int):
+        self.times = array('i', [0]) * size
+        self.own = bytearray(size)
+        self.food = bytearray(size)
+
+    @classmethod
+    def from_snakes(cls, board: Board, snakes: list, id: str = None, food: list = ()) -> "TimeMap":
+        bodies = [(snake["id"], [board.index(segment) for segment in snake["body"]]) for snake in snakes]
+        return cls.from_bodies(board, bodies, id, (board.index(f) for f in food))
+
+    @classmethod
+    def from_state(cls, state: GameState, id: str = None) -> "TimeMap":
+        """ from_snakes() on a compact state, where bodies and food already are cell indices """
+        return cls.from_bodies(state.board, [(s.id, s.body) for s in state.snakes if s.alive], id, state.food)
+
+    @classmethod
+    def from_bodies(cls, board: Board, bodies: list, id: str, food) -> "TimeMap":
+        """ Time map of (id, body as cell indices) snakes and food cells """
+        timing = cls(board.size)
+        times, own = timing.times, timing.own
+        for cell in food:
+            timing.food[cell] = 1
+        for snake_id, body in bodies:
+            mine = snake_id == id
+            may_eat = not mine and any(timing.food[cell] for cell in board.adjacent[body[0]])
+            length = len(body) + may_eat
+            for i, cell in enumerate(body):
+                # Stacked segments share a cell, which is free once the last of them left
+                times[cell] = max(times[cell], length - i)
+                if mine: own[cell] = 1
+        return timing
+
+def timed_bfs(board: Board, sources: dict, timing: TimeMap, targets: bytearray = None, start: int = 0) -> DistanceMap:
+    """
+    bfs() in the time dimension: distances are turns, starting at start for the sources, and a blocked
+    cell is entered from the first turn its body has moved away, reached from any side. Our own body
+    is delayed by the food eaten on the path that gets there.
+    """
+    labels = list(sources)
+    result = DistanceMap(board, labels)
+    distances, origins = result.distances, result.origins
+    cells, adjacent = board.cells, board.adjacent
+    times, own, food = timing.times, timing.own, timing.food
+    eaten = array('i', [0]) * board.size
+
+    frontier = deque()
+    for origin, label in enumerate(labels):
+        cell = sources[label]
+        if distances[cell] != UNREACHABLE: continue
+        distances[cell], origins[cell], eaten[cell] = start, origin, food[cell]
+        frontier.append(cell)
+
+    while frontier:
+        current = frontier.popleft()
+        if targets is not None and targets[current]:
+            result.found = current
+            return result
+        distance, origin, ate = distances[current] + 1, origins[current], eaten[current]
+        for neighbour in adjacent[current]:
+            if distances[neighbour] != UNREACHABLE: continue
+            # A cell still occupied is left unreached, so a longer path can enter it later
+            if cells[neighbour] and times[neighbour] + (ate if own[neighbour] else 0) > distance: continue
+            distances[neighbour], origins[neighbour], eaten[neighbour] = distance, origin, ate + food[neighbour]
+            frontier.append(neighbour)
+
+    return result
+
+def cheapest_food(board: Board, sources: dict, costs: array, health: int, food: list, timing: TimeMap = None) -> dict:
+    """
+    Dijkstra over the health every cell costs to enter (see games.Game.costs), from all the sources
+    in one run but with the paths of every source kept apart: {label: (food cell, health left)} of the
+    food each source reaches for the least health, or None when the snake starves before any.
+    A food cell is reached as long as the snake is alive on the cell before, as eating restores the
+    health lost on it (health left is then 0 or less). With a timing, bodies are crossed once they
+    moved away, as in timed_bfs().
+    """
+    size, cells, adjacent = board.size, board.cells, board.adjacent
+    times = timing.times if timing is not None else None
+    targets = target_mask(board, food)
+    labels = list(sources)
+    spent = array('i', [NOT_SPENT]) * (size * len(labels))
+    found = dict.fromkeys(labels)
+
+    heap = []
+    for origin, label in enumerate(labels):
+        cell = sources[label]
+        spent[origin * size + cell] = costs[cell]
+        heapq.heappush(heap, (costs[cell], 1, origin, cell))
+
+    left = len(labels)
+    while heap and left:
+        cost, turns, origin, cell = heapq.heappop(heap)
+        base = origin * size
+        if cost > spent[base + cell] or found[labels[origin]] is not None: continue
+        if targets[cell]:
+            found[labels[origin]] = (cell, health - cost)
+            left -= 1
+            continue
+        if cost >= health: continue
+        for neighbour in adjacent[cell]:
+            if cells[neighbour] and (times is None or times[neighbour] > turns + 1): continue
+            next_cost = cost + costs[neighbour]
+            if next_cost >= spent[base + neighbour] or (next_cost >= health and not targets[neighbour]): continue
+            spent[base + neighbour] = next_cost
+            heapq.heappush(heap, (next_cost, turns + 1, origin, neighbour))
+
+    return found
+
+NO_OWNER, CONTESTED = 255, 254
+
+def voronoi(board: Board, sources: list, timing: TimeMap = None) -> list:
+    """
+    Simultaneous breadth first search from every snake head, returning how many cells each source reaches first.
+    sources is a list of (cell, length, distance) where distance is how many turns away the source cell is.
+    Cells reached at the same time go to the longest snake, or to nobody when the longest ones are tied,
+    as in a head to head collision.
+    With a timing, blocked cells are claimed from the turn their body has moved away.
+    """
+    size, cells, adjacent = board.size, board.cells, board.adjacent
+    times = timing.times if timing is not None else None
+    owners = bytearray([NO_OWNER]) * size
+    claims = array('i', [0]) * size
+    distances = array('i', [UNREACHABLE]) * size
+    lengths = [length for _, length, _ in sources]
+    counts = [0] * len(sources)
+
+    def claim(cell: int, owner: int, distance: int, frontier: list):
+        length = lengths[owner]
+        if distances[cell] == UNREACHABLE:
+            distances[cell], owners[cell], claims[cell] = distance, owner, length
+            frontier.append(cell)
+        elif distances[cell] == distance and owners[cell] != owner:
+            if length > claims[cell]:
+                owners[cell], claims[cell] = owner, length
+            elif length == claims[cell]:
+                owners[cell] = CONTESTED
+
+    seeds = sorted((distance, owner, cell) for owner, (cell, _, distance) in enumerate(sources))
+    distance, frontier, s = 0, [], 0
+    while frontier or s < len(seeds):
+        while s < len(seeds) and seeds[s][0] == distance:
+            claim(seeds[s][2], seeds[s][1], distance, frontier)
+            s += 1
+
+        next_frontier, next_distance = [], distance + 1
+        for cell in frontier:
+            owner = owners[cell]
+            if owner == CONTESTED: continue
+            counts[owner] += 1
+            length = lengths[owner]
+            # Same as claim(), inlined as this is the hot loop
+            for neighbour in adjacent[cell]:
+                if cells[neighbour] and (times is None or times[neighbour] > next_distance): continue
+                reached = distances[neighbour]
+                if reached == UNREACHABLE:
+                    distances[neighbour], owners[neighbour], claims[neighbour] = next_distance, owner, length
+                    next_frontier.append(neighbour)
+                elif reached == next_distance and owners[neighbour] != owner:
+                    if length > claims[neighbour]:
+                        owners[neighbour], claims[neighbour] = owner, length
+                    elif length == claims[neighbour]:
+                        owners[neighbour] = CONTESTED
+
+        frontier = next_frontier
+        distance += 1
+
+    return counts
+
+def territory_by_move(board: Board, possible_moves: dict, snakes: list, id: str, timing: TimeMap = None) -> dict:
+    """ Cells each candidate move controls once every other snake has had the chance to reply """
+    my_length = next(snake["length"] for snake in snakes if snake["id"] == id)
+    others = [(board.index(snake["head"]), snake["length"], 0) for snake in snakes if snake["id"] != id]
+    return {move: voronoi(board, [(cell, my_length, 1)] + others, timing)[0] for move, cell in possible_moves.items()}
@@ -0,0 +1,178 @@
+"""
+Stack sampling of slow turns.
+
+With SLOW_TURN_FRACTION set (e.g. 0.8), the stacks of the thread answering a /move, and of the
+watchdog thread it searches in, are sampled every SLOW_TURN_INTERVAL_MS while the turn is answered. A turn that took more than that fraction of
+its timeout is kept, with its request, in a ring buffer of the last SLOW_TURN_KEEP files in
+SLOW_TURN_DIR; faster turns are dropped. Kept turns are listed by the server at
+/admin/slow-turns and can be exported as collapsed stacks for flamegraph.pl or speedscope:
+
+    python profiler.py slow_turns/1700000000000000000-42.json > stacks.txt
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+FRACTION = float(os.environ.get("SLOW_TURN_FRACTION", "0"))
+ENABLED = FRACTION > 0
+INTERVAL_MS = float(os.environ.get("SLOW_TURN_INTERVAL_MS", "5"))
+DIRECTORY = os.environ.get("SLOW_TURN_DIR", "slow_turns")
+KEEP = int(os.environ.get("SLOW_TURN_KEEP", "50"))
+
+def collapse(frame) -> str:
+    """ Stack of a frame as "file:function;file:function", outermost first """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class TurnProfile:
+    """
+    Stacks sampled while a turn was answered, and the request of the turn. Only the threads
+    working on the turn are sampled: the request thread and the threads it hands work to (see join).
+    """
+    __slots__ = ("started", "elapsed", "data", "stacks", "samples", "threads")
+
+    def __init__(self):
+        self.started, self.elapsed = time.perf_counter(), 0.0
+        self.data = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.threads = {threading.get_ident()}
+
+    def is_slow(self, fraction: float = None) -> bool:
+        if fraction is None: fraction = FRACTION
+        timeout = self.data["game"].get("timeout", 500) / 1000
+        return self.elapsed > fraction * timeout
+
+    def to_dict(self) -> dict:
+        return {"time": time.time(), "elapsed": self.elapsed, "samples": self.samples,
+                "data": self.data, "stacks": dict(self.stacks)}
+
+class Sampler:
+    """ Samples the threads of every turn profiled, while there is at least one """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.active = threading.Event()
+        self.thread = None
+
+    def add(self, profile: TurnProfile):
+        with self.lock:
+            self.profiles.append(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="turn-sampler", daemon=True)
+                self.thread.start()
+        self.active.set()
+
+    def remove(self, profile: TurnProfile):
+        with self.lock:
+            self.profiles.remove(profile)
+            if not self.profiles: self.active.clear()
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            for profile in self.profiles:
+                profile.samples += 1
+                profile.stacks.update(collapse(frames[id]) for id in list(profile.threads) if id in frames)
+
+    def run(self):
+        while True:
+            self.active.wait()
+            self.sample()
+            time.sleep(self.interval)
+
+class RingBuffer:
+    """ The last turns kept, one JSON file each, named so they sort by time across processes """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory, self.keep = directory, keep
+
+    def save(self, profile: TurnProfile) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}.json"
+        with open(os.path.join(self.directory, name + ".tmp"), "w") as f:
+            json.dump(profile.to_dict(), f)
+        os.replace(os.path.join(self.directory, name + ".tmp"), os.path.join(self.directory, name))
+        for old in self.names()[:-self.keep]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, old))
+        return name[:-len(".json")]
+
+    def names(self) -> list:
+        if not os.path.isdir(self.directory): return []
+        return sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+
+    def load(self, id: str) -> dict:
+        """ Kept turn with the given id, or None """
+        if os.path.basename(id) != id: return None
+        path = os.path.join(self.directory, id + ".json")
+        if not os.path.exists(path): return None
+        with open(path) as f:
+            return json.load(f)
+
+    def summaries(self) -> list:
+        """ Id, game, turn and duration of every kept turn, newest first """
+        summaries = []
+        for name in reversed(self.names()):
+            turn = self.load(name[:-len(".json")])
+            if turn is None: continue
+            summaries.append({"id": name[:-len(".json")], "game": turn["data"]["game"]["id"], "turn": turn["data"]["turn"],
+                              "elapsed": turn["elapsed"], "samples": turn["samples"]})
+        return summaries
+
+def collapsed(turn: dict) -> str:
+    """ Stacks of a kept turn in the collapsed format, one "stack count" line each """
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(turn["stacks"].items()))
+
+sampler = Sampler(INTERVAL_MS / 1000)
+buffer = RingBuffer(DIRECTORY, KEEP)
+# Turn profiled by every request thread
+_active = {}
+
+def current() -> TurnProfile:
+    """ Profile of the turn answered by the calling thread, or None """
+    return _active.get(threading.get_ident())
+
+def join(profile: TurnProfile):
+    """ Samples the calling thread with the turn of the profile too, e.g. the watchdog thread of a search """
+    if profile is not None: profile.threads.add(threading.get_ident())
+
+@contextlib.contextmanager
+def turn():
+    """
+    Profiles the turn answered in the block, which sets the request as profile.data.
+    The profile is written out in the background when the turn was slow.
+    """
+    if not ENABLED:
+        yield None
+        return
+    profile = TurnProfile()
+    _active[threading.get_ident()] = profile
+    sampler.add(profile)
+    try:
+        yield profile
+    finally:
+        sampler.remove(profile)
+        _active.pop(threading.get_ident(), None)
+        profile.elapsed = time.perf_counter() - profile.started
+        if profile.data is not None and profile.is_slow():
+            threading.Thread(target=buffer.save, args=(profile,), daemon=True).start()
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("usage: python profiler.py <kept turn file>")
+    with open(sys.argv[1]) as f:
+        sys.stdout.write(collapsed(json.load(f)))
+
+if __name__ == "__main__":
+    main()
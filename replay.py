@@ -0,0 +1,212 @@
+"""
+Records the requests of real games and replays them through choose_move.
+
+The server appends every /start, /move and /end to the log set in REPLAY_LOG, one compact
+JSON line per request ({pid} in the path gives every server process its own log, a .gz
+suffix compresses it). Logs are then streamed back, line by line, whatever their size:
+
+    python replay.py replays/*.jsonl.gz --strategy greedy --changes changes.jsonl
+"""
+import argparse
+import atexit
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import server_logic
+
+# Latencies kept to estimate percentiles, whatever the number of turns replayed
+RESERVOIR_SIZE = 10000
+# Requests waiting to be written at most, the oldest are dropped past it
+QUEUE_SIZE = 10000
+
+def open_log(path: str, mode: str):
+    """ Text file, gzip compressed when the path ends with .gz """
+    if path.endswith(".gz"): return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class Recorder:
+    """
+    Appends requests to a log, one JSON line each, safe to share between the threads of a server.
+    Requests are only queued on the request thread, a background thread encodes and writes them
+    so no disk or gzip work is counted against the turn timeout. When the writer falls behind by
+    more than size entries, the oldest are dropped rather than growing the memory of the server.
+    """
+
+    def __init__(self, path: str, size: int = QUEUE_SIZE):
+        self.path = path.format(pid=os.getpid())
+        directory = os.path.dirname(self.path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        self.file = open_log(self.path, "a")
+        self.pending = deque(maxlen=size)
+        self.ready = threading.Condition()
+        self.closing = False
+        self.dropped = 0
+        self.writer = threading.Thread(target=self.write, name="replay-recorder", daemon=True)
+        self.writer.start()
+
+    def record(self, kind: str, data: dict, move: str = None, elapsed: float = None):
+        """ kind is start, move or end; a move is recorded with the answer and how long it took in ms """
+        entry = {"kind": kind, "time": time.time(), "data": data}
+        if move is not None: entry["move"], entry["elapsed"] = move, elapsed
+        with self.ready:
+            if len(self.pending) == self.pending.maxlen: self.dropped += 1
+            self.pending.append(entry)
+            self.ready.notify()
+
+    def write(self):
+        """ Writer thread: appends the queued entries and flushes, until close; an entry that fails is skipped """
+        reported = 0
+        while True:
+            with self.ready:
+                while not self.pending and not self.closing: self.ready.wait()
+                if not self.pending: break
+                entries = list(self.pending)
+                self.pending.clear()
+                dropped = self.dropped
+            if dropped > reported:
+                print(f"{self.path}: {dropped - reported} requests dropped, the log is written too slowly")
+                reported = dropped
+            for entry in entries:
+                try:
+                    self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                except Exception:
+                    traceback.print_exc()
+            try:
+                self.file.flush()
+            except Exception:
+                traceback.print_exc()
+        self.file.close()
+
+    def close(self):
+        """ Writes what is still queued and closes the log """
+        if not self.writer.is_alive(): return
+        with self.ready:
+            self.closing = True
+            self.ready.notify()
+        self.writer.join()
+
+_recorders = {}
+
+def get_recorder() -> Recorder:
+    """
+    Recorder of the log in REPLAY_LOG, or None when requests are not recorded.
+    It is opened on first use in every process, so forked server workers never share a file.
+    """
+    path = os.environ.get("REPLAY_LOG")
+    if not path: return None
+    pid = os.getpid()
+    if pid not in _recorders:
+        _recorders[pid] = Recorder(path)
+        atexit.register(_recorders[pid].close)
+    return _recorders[pid]
+
+def read(paths: list):
+    """ Records of the logs in order, streamed one line at a time; a truncated last line is skipped """
+    for path in paths:
+        with open_log(path, "r") as f:
+            try:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+            except EOFError:
+                # A compressed log still being written has no end of stream yet
+                continue
+
+class Reservoir:
+    """ Uniform sample of a stream of values, for percentiles over logs too large to keep """
+    __slots__ = ("size", "values", "seen", "rng")
+
+    def __init__(self, size: int = RESERVOIR_SIZE, seed: int = 0):
+        self.size, self.values, self.seen = size, [], 0
+        self.rng = random.Random(seed)
+
+    def add(self, value: float):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        i = self.rng.randrange(self.seen)
+        if i < self.size: self.values[i] = value
+
+    def percentile(self, fraction: float) -> float:
+        if not self.values: return 0.0
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class Report:
+    """ How the replayed moves and timings compare with the recorded ones """
+
+    def __init__(self):
+        self.moves = self.changed = 0
+        self.recorded, self.replayed = Reservoir(), Reservoir()
+
+    def add(self, record: dict, move: str, elapsed: float) -> bool:
+        """ Returns whether the move changed """
+        self.moves += 1
+        self.replayed.add(elapsed)
+        if record.get("elapsed") is not None: self.recorded.add(record["elapsed"])
+        changed = move != record.get("move")
+        self.changed += changed
+        return changed
+
+    def summary(self) -> dict:
+        latency = lambda r: {f"p{int(p * 100)}": r.percentile(p) for p in (0.5, 0.95, 0.99)}
+        return {
+            "moves": self.moves, "changed": self.changed,
+            "changed_rate": self.changed / self.moves if self.moves else 0.0,
+            "recorded_ms": latency(self.recorded), "replayed_ms": latency(self.replayed)
+        }
+
+def replay(records, strategy: str = None, changes = None, limit: int = None) -> Report:
+    """
+    Plays the recorded requests through choose_move: starts and ends keep the game store as it
+    was on the server, moves are answered again and compared. Changed moves are written to changes.
+    """
+    report = Report()
+    for record in records:
+        if limit is not None and report.moves >= limit: break
+        data = record["data"]
+        if record["kind"] == "start":
+            server_logic.start_game(data)
+        elif record["kind"] == "end":
+            server_logic.end_game(data)
+        elif record["kind"] == "move":
+            started = time.perf_counter()
+            move = server_logic.choose_move(data, started, strategy=strategy)
+            elapsed = (time.perf_counter() - started) * 1000
+            if report.add(record, move, elapsed) and changes is not None:
+                changes.write(json.dumps({"game": data["game"]["id"], "turn": data["turn"], "you": data["you"]["id"],
+                                          "recorded": record.get("move"), "replayed": move}) + "\n")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays recorded games through choose_move")
+    parser.add_argument("logs", nargs="+", help="logs written with REPLAY_LOG")
+    parser.add_argument("--strategy", help="overrides SNAKE_STRATEGY")
+    parser.add_argument("--changes", help="write the moves that changed to this file")
+    parser.add_argument("--limit", type=int, help="stop after this many moves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-changed", type=float, help="exit with 1 when a larger fraction of the moves changed")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    changes = open(args.changes, "w") if args.changes else None
+    try:
+        summary = replay(read(args.logs), args.strategy, changes, args.limit).summary()
+    finally:
+        if changes is not None: changes.close()
+
+    print(json.dumps(summary, indent=2))
+    if args.max_changed is not None and summary["changed_rate"] > args.max_changed: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from board import Board, MOVES, OUTSIDE, BLOCKED
+
+MAX_HEALTH = 100
+DEFAULT_HAZARD_DAMAGE = 14
+
+class Snake:
+    """ Snake of a simulated game, with its body stored as cell indices from head to tail """
+    __slots__ = ("id", "body", "health", "alive")
+
+    def __init__(self, id: str, body: list, health: int, alive: bool = True):
+        self.id, self.body, self.health, self.alive = id, body, health, alive
+
+    @property
+    def head(self) -> int:
+        return self.body[0]
+
+    @property
+    def length(self) -> int:
+        return len(self.body)
+
+    def copy(self) -> "Snake":
+        return Snake(self.id, self.body[:], self.health, self.alive)
+
+    def copy_into(self, other: "Snake"):
+        """ Overwrites another snake without allocating a new body """
+        other.body[:] = self.body
+        other.health, other.alive = self.health, self.alive
+
+class GameState:
+    """ Everything needed to simulate a game from a given turn """
+    __slots__ = ("board", "snakes", "food", "hazards", "hazard_damage", "turn")
+
+    def __init__(self, board: Board, snakes: list, food: set, hazards: set = frozenset(), hazard_damage: int = DEFAULT_HAZARD_DAMAGE, turn: int = 0):
+        self.board, self.snakes, self.food, self.hazards = board, snakes, food, hazards
+        self.hazard_damage, self.turn = hazard_damage, turn
+
+    @classmethod
+    def from_data(cls, data: dict, hazards: frozenset = None) -> "GameState":
+        """ Builds the state of a move request, the hazard cells can be given when they are already known """
+        ruleset = data["game"]["ruleset"]
+        board = Board(data["board"]["width"], data["board"]["height"], ruleset["name"])
+        snakes = [Snake(s["id"], [board.index(c) for c in s["body"]], s["health"]) for s in data["board"]["snakes"]]
+        food = {board.index(f) for f in data["board"]["food"]}
+        if hazards is None:
+            hazards = frozenset(board.index(h) for h in data["board"].get("hazards", ()))
+        hazard_damage = ruleset.get("settings", {}).get("hazardDamagePerTurn", DEFAULT_HAZARD_DAMAGE)
+        return cls(board, snakes, food, hazards, hazard_damage, data.get("turn", 0))
+
+    def copy(self) -> "GameState":
+        """ Copies the mutable parts of the state, sharing the board geometry and hazards """
+        return GameState(self.board, [s.copy() for s in self.snakes], set(self.food), self.hazards, self.hazard_damage, self.turn)
+
+    def copy_into(self, other: "GameState"):
+        """ Overwrites a state copied from this one, reusing its buffers """
+        for snake, buffer in zip(self.snakes, other.snakes):
+            snake.copy_into(buffer)
+        other.food.clear()
+        other.food.update(self.food)
+        other.turn = self.turn
+
+    def snake(self, id: str) -> Snake:
+        for snake in self.snakes:
+            if snake.id == id: return snake
+        return None
+
+    def alive(self) -> list:
+        return [s for s in self.snakes if s.alive]
+
+    def occupancy(self) -> Board:
+        """ Board with every alive snake blocked, except the tails that will move on the next turn """
+        board = Board(self.board.width, self.board.height, self.board.gamemode)
+        cells = board.cells
+        for snake in self.snakes:
+            if not snake.alive: continue
+            body = snake.body
+            for cell in body:
+                cells[cell] = BLOCKED
+            if len(body) > 1 and body[-1] != body[-2]:
+                cells[body[-1]] = 0
+        return board
+
+    def safe_moves(self, snake: Snake, occupancy: Board = None) -> list:
+        """ Moves that do not immediately hit a wall or a body, or every move if all of them do """
+        if occupancy is None: occupancy = self.occupancy()
+        targets = self.board.moves[snake.head]
+        moves = [i for i, cell in enumerate(targets) if occupancy.is_free(cell)]
+        return moves or list(range(len(MOVES)))
+
+def step(state: GameState, moves: dict) -> GameState:
+    """
+    Applies one turn of the standard rules in place and returns the state.
+    moves maps each alive snake id to the index of its move in MOVES.
+    """
+    board_moves = state.board.moves
+    constrictor = state.board.gamemode == "constrictor"
+    alive = state.alive()
+
+    # Move
+    for snake in alive:
+        head = board_moves[snake.head][moves.get(snake.id, 0)]
+        if head == OUTSIDE:
+            snake.alive = False
+            continue
+        snake.body.insert(0, head)
+        snake.body.pop()
+
+    # Reduce health
+    alive = [s for s in alive if s.alive]
+    for snake in alive:
+        snake.health -= 1
+        if snake.head in state.hazards:
+            snake.health -= state.hazard_damage
+
+    # Feed
+    eaten = set()
+    for snake in alive:
+        if constrictor or snake.head in state.food:
+            eaten.add(snake.head)
+            snake.health = MAX_HEALTH
+            snake.body.append(snake.body[-1])
+    state.food -= eaten
+
+    # Eliminate
+    bodies = set()
+    for snake in alive:
+        bodies.update(snake.body[1:])
+    heads = {}
+    for snake in alive:
+        heads.setdefault(snake.head, []).append(snake)
+
+    eliminated = []
+    for snake in alive:
+        if snake.health <= 0 or snake.head in bodies:
+            eliminated.append(snake)
+            continue
+        for other in heads[snake.head]:
+            if other is not snake and other.length >= snake.length:
+                eliminated.append(snake)
+                break
+    for snake in eliminated:
+        snake.alive = False
+
+    state.turn += 1
+    return state
@@ -0,0 +1,186 @@
+import time
+from itertools import product
+
+from board import MOVES
+from opponents import OpponentModel, pattern
+from pathfinding import voronoi
+from rules import GameState, step
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Time kept for the network when its latency was not measured yet
+LATENCY_MARGIN_MS = 150
+# Kept on top of the measured network latency, and never less than MIN_MARGIN_MS in total
+NETWORK_MARGIN_MS = 50
+MIN_MARGIN_MS = 60
+MAX_DEPTH = 32
+MAX_OPPONENTS = 2
+WIN, LOSS = 1_000_000, -1_000_000
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchResult:
+    """ Best move found by a search and how much work it took """
+    __slots__ = ("move", "score", "depth", "nodes", "elapsed")
+
+    def __init__(self, move: str, score: float, depth: int, nodes: int, elapsed: float):
+        self.move, self.score, self.depth, self.nodes, self.elapsed = move, score, depth, nodes, elapsed
+
+    @property
+    def nodes_per_second(self) -> float:
+        """ Search throughput: nodes for the tree search, playouts for MCTS """
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+def get_deadline(data: dict, started: float = None, game = None) -> float:
+    """
+    perf_counter time by which the search must have answered. With the game of the request,
+    the margin follows the network latency measured on the previous turns instead of a fixed guess.
+    """
+    if started is None: started = time.perf_counter()
+    timeout = data["game"].get("timeout", 500)
+    network = game.network_latency() if game is not None else None
+    margin = LATENCY_MARGIN_MS if network is None else max(MIN_MARGIN_MS, network + NETWORK_MARGIN_MS)
+    return started + max(timeout - margin, timeout / 4) / 1000
+
+def evaluate(state: GameState, id: str) -> float:
+    """ Heuristic value of a state for the snake with the given id, from its territory, length and health """
+    me = state.snake(id)
+    if not me.alive: return LOSS + state.turn
+    opponents = [s for s in state.snakes if s.alive and s.id != id]
+    if not opponents and len(state.snakes) > 1: return WIN - state.turn
+
+    board = state.occupancy()
+    sources = [(me.head, me.length, 0)] + [(s.head, s.length, 0) for s in opponents]
+    territory = voronoi(board, sources)
+    longest = max((s.length for s in opponents), default=me.length)
+    return territory[0] - max(territory[1:], default=0) + 10 * (me.length - longest) + me.health / 10
+
+def is_over(state: GameState, id: str) -> bool:
+    """ Whether the game is decided for the snake with the given id """
+    if not state.snake(id).alive: return True
+    return len(state.snakes) > 1 and not any(s.alive and s.id != id for s in state.snakes)
+
+class ParanoidSearch:
+    """
+    Iterative deepening paranoid search: we pick a move and the closest opponents jointly pick the reply
+    that is worst for us, while the remaining opponents play their first safe move.
+    With an opponent model, replies are ordered by likelihood, the moves an opponent is not
+    expected to play are left out, and the remaining opponents play their most likely move.
+    """
+
+    def __init__(self, state: GameState, id: str, deadline: float, table: TranspositionTable = None, model: OpponentModel = None):
+        self.state, self.id, self.deadline, self.table, self.model = state, id, deadline, table, model
+        self.nodes = 0
+        # Scores of the root moves at every completed depth
+        self.history = []
+
+    def check_time(self):
+        self.nodes += 1
+        if time.perf_counter() >= self.deadline: raise SearchTimeout()
+
+    def closest_opponents(self, state: GameState) -> list:
+        """ Opponents that search replies, the rest play their first safe move """
+        me = state.snake(self.id)
+        width = state.board.width
+        def distance(snake):
+            return abs(snake.head % width - me.head % width) + abs(snake.head // width - me.head // width)
+        opponents = sorted((s for s in state.alive() if s.id != self.id), key=distance)
+        return opponents[:MAX_OPPONENTS], opponents[MAX_OPPONENTS:]
+
+    def options(self, state: GameState, snake, occupancy) -> list:
+        """ Safe moves of an opponent, the likely ones first and without the unlikely ones when it is modelled """
+        moves = state.safe_moves(snake, occupancy)
+        if self.model is None or snake.id not in self.model.counts: return moves
+        heads = {s.head for s in state.snakes if s.alive}
+        return self.model.order(snake.id, pattern(state.board, occupancy, snake.body, state.food, heads), moves)
+
+    def replies(self, state: GameState) -> list:
+        occupancy = state.occupancy()
+        searched, others = self.closest_opponents(state)
+        fixed = {s.id: self.options(state, s, occupancy)[0] for s in others}
+        options = [self.options(state, s, occupancy) for s in searched]
+        replies = []
+        for combination in product(*options):
+            reply = dict(fixed)
+            reply.update((s.id, move) for s, move in zip(searched, combination))
+            replies.append(reply)
+        return replies
+
+    def max_value(self, state: GameState, depth: int, alpha: float, beta: float) -> float:
+        self.check_time()
+        me = state.snake(self.id)
+        if depth == 0 or is_over(state, self.id):
+            return evaluate(state, self.id)
+
+        moves, table = state.safe_moves(me), self.table
+        if table is not None:
+            key = table.zobrist.hash(state)
+            entry = table.get(key)
+            if entry is not None:
+                stored_depth, value, flag, stored_move = entry
+                if stored_depth >= depth:
+                    if flag == EXACT: return value
+                    if flag == LOWER and value >= beta: return value
+                    if flag == UPPER and value <= alpha: return value
+                if stored_move in moves:
+                    moves.remove(stored_move)
+                    moves.insert(0, stored_move)
+
+        best, best_move, original_alpha = LOSS * 2, moves[0], alpha
+        for move in moves:
+            value = self.min_value(state, move, depth, alpha, beta)
+            if value > best: best, best_move = value, move
+            alpha = max(alpha, best)
+            if alpha >= beta: break
+
+        if table is not None:
+            flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+            table.put(key, depth, best, flag, best_move)
+        return best
+
+    def min_value(self, state: GameState, move: int, depth: int, alpha: float, beta: float) -> float:
+        worst = WIN * 2
+        for reply in self.replies(state):
+            reply[self.id] = move
+            worst = min(worst, self.max_value(step(state.copy(), reply), depth - 1, alpha, beta))
+            beta = min(beta, worst)
+            if alpha >= beta: break
+        return worst
+
+    def run(self, moves: list, max_depth: int = MAX_DEPTH) -> SearchResult:
+        """ Deepens until the deadline or max_depth, always keeping the best move of the last completed depth """
+        started = time.perf_counter()
+        order = [MOVES.index(m) for m in moves]
+        best = SearchResult(moves[0], 0, 0, 0, 0)
+        for depth in range(1, max_depth + 1):
+            scores, alpha = {}, LOSS * 2
+            try:
+                for move in order:
+                    scores[move] = self.min_value(self.state, move, depth, alpha, WIN * 2)
+                    alpha = max(alpha, scores[move])
+            except SearchTimeout:
+                break
+
+            self.history.append({MOVES[m]: score for m, score in scores.items()})
+            # Move ordering: search the best moves of this depth first on the next one
+            order.sort(key=lambda m: -scores[m])
+            best = SearchResult(MOVES[order[0]], scores[order[0]], depth, self.nodes, time.perf_counter() - started)
+            if abs(best.score) >= WIN // 2: break
+
+        best.nodes, best.elapsed = self.nodes, time.perf_counter() - started
+        return best
+
+def search(data: dict, moves: list, started: float = None, game = None, state: GameState = None) -> SearchResult:
+    """
+    Runs a time budgeted search over the given candidate moves of the request.
+    With the game of the request (see games.py), its hazard layout, transposition table and opponent model are reused.
+    The state of the request is built from data unless it was already parsed.
+    """
+    table = None
+    if game is not None:
+        table = game.get_table()
+        table.new_search()
+    if state is None:
+        state = GameState.from_data(data, game.hazards if game is not None else None)
+    model = game.model if game is not None else None
+    return ParanoidSearch(state, data["you"]["id"], get_deadline(data, started, game), table, model).run(moves)
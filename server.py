@@ -1,10 +1,17 @@
 import logging
 import os
+import time
 
 from flask import Flask
 from flask import request
 from flask_cors import CORS
 
+import metrics
+import opening_book
+import parallel
+import parsing
+import profiler
+import replay
 import server_logic
 
 
@@ -40,6 +47,10 @@ def handle_start():
     request.json contains information about the game that's about to be played.
     """
     data = request.get_json()
+    server_logic.start_game(data)
+    recorder = replay.get_recorder()
+    if recorder is not None:
+        recorder.record("start", parsing.lean(data))
 
     print(f"{data['game']['id']} {data['game']['ruleset']['name']} START")
     return "ok"
@@ -51,10 +62,26 @@ def handle_move():
     This function is called on every turn of a game. It's how your snake decides where to move.
     Valid moves are "up", "down", "left", or "right".
     """
-    data = request.get_json()
-
-    # TODO - look at the server_logic.py file to see how we decide what move to return!
-    move = server_logic.choose_move(data)
+    started = time.perf_counter()
+    # Slow turns are kept with their stack samples when SLOW_TURN_FRACTION is set, see profiler.py
+    with profiler.turn() as profile:
+        try:
+            parsed = parsing.parse_move(request.get_data())
+        except ValueError:
+            # Decoding errors of json and orjson are ValueErrors too
+            return "malformed move request", 400
+        metrics.observe("battlesnake_stage_seconds", parsed.elapsed, stage="parse")
+        if profile is not None:
+            profile.data = parsed.data
+
+        # TODO - look at the server_logic.py file to see how we decide what move to return!
+        move = server_logic.choose_move(parsed.data, started, parsed.state)
+    elapsed = time.perf_counter() - started
+    metrics.observe("battlesnake_stage_seconds", elapsed, stage="total")
+    # Requests are appended to REPLAY_LOG when it is set, see replay.py
+    recorder = replay.get_recorder()
+    if recorder is not None:
+        recorder.record("move", parsed.data, move, elapsed * 1000)
 
     return {"move": move}
 
@@ -66,14 +93,105 @@ def end():
     It's purely for informational purposes, you don't have to make any decisions here.
     """
     data = request.get_json()
+    server_logic.end_game(data)
+    recorder = replay.get_recorder()
+    if recorder is not None:
+        recorder.record("end", parsing.lean(data))
 
     print(f"{data['game']['id']} END")
     return "ok"
 
 
+@app.get("/metrics")
+def handle_metrics():
+    """
+    Latency histograms of this process in the Prometheus text format, when METRICS=1.
+    """
+    if not metrics.ENABLED:
+        return "metrics are disabled", 404
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+def check_admin():
+    """ Admin endpoints answer 404 when profiling is off, and require ADMIN_TOKEN as a bearer token when it is set """
+    if not profiler.ENABLED:
+        return "profiling is disabled", 404
+    token = os.environ.get("ADMIN_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return "forbidden", 403
+    return None
+
+
+@app.get("/admin/slow-turns")
+def handle_slow_turns():
+    """
+    The slow turns kept in SLOW_TURN_DIR, newest first.
+    """
+    return check_admin() or {"slow_turns": profiler.buffer.summaries()}
+
+
+@app.get("/admin/slow-turns/<id>")
+def handle_slow_turn(id):
+    """
+    A kept turn: its request and its stack samples. With ?format=collapsed, the stacks only,
+    in the collapsed format of flamegraph.pl and speedscope.
+    """
+    denied = check_admin()
+    if denied: return denied
+    turn = profiler.buffer.load(id)
+    if turn is None:
+        return "unknown turn", 404
+    if request.args.get("format") == "collapsed":
+        return profiler.collapsed(turn), 200, {"Content-Type": "text/plain"}
+    return turn
+
+
+def start_process():
+    """
+    Everything a server process sets up once, before its first request: the search worker
+    processes, and the opening book mapped so the first turn of the first game does not pay for it
+    """
+    workers = int(os.environ.get("SEARCH_WORKERS", "0"))
+    if workers > 0:
+        parallel.start_pool(workers)
+    opening_book.get_book()
+
+
+def run_production(port: int):
+    """
+    Serves the app with gunicorn: no debugger or reloader, a single worker process with a few
+    threads, and connections kept alive between the engine's requests. Every turn of a game must
+    reach the process that keeps its state (see games.py), so the web server is never split over
+    processes (WEB_CONCURRENCY, which Heroku sets, is ignored); SEARCH_WORKERS gives the search
+    its CPU parallelism.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("threads", int(os.environ.get("WEB_THREADS", "4")))
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("keepalive", int(os.environ.get("WEB_KEEPALIVE", "75")))
+            self.cfg.set("post_fork", lambda server, worker: start_process())
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
 if __name__ == "__main__":
     logging.getLogger("werkzeug").setLevel(logging.ERROR)
 
     print("Starting Battlesnake Server...")
     port = int(os.environ.get("PORT", "8080"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # "production" serves with gunicorn, anything else runs the Flask development server
+    if os.environ.get("SERVER_MODE", "development") == "production":
+        run_production(port)
+    else:
+        # The reloader runs the app in a child process, the parent it watches from needs no search workers
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_process()
+        app.run(host="0.0.0.0", port=port, debug=True)
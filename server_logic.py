@@ -1,4 +1,25 @@
+import os
 import random
+import time
+from array import array
+
+from board import Board
+from pathfinding import DistanceMap, TimeMap, bfs, cheapest_food, target_mask, timed_bfs
+from rules import GameState
+import endgame
+import evaluation
+import games
+import mcts
+import metrics
+import opening_book
+import parallel
+import search
+import watchdog
+
+# "greedy" follows the filters and the food, "search" runs a time budgeted paranoid search on top of them,
+# "mcts" a Monte Carlo tree search and "auto" picks one of the two per ruleset
+STRATEGY = os.environ.get("SNAKE_STRATEGY", "greedy")
+MCTS_RULESETS = ("standard", "royale")
 
 def convert_coordinates_wrapped_mode(coordinates: dict, width: int, height: int, gamemode: str) -> dict:
     """ Convert coordinates outside of board to inside if playing wrapped """
@@ -29,68 +50,71 @@ def avoid_walls(possible_moves: dict, width: int, height: int):
 
     return possible_moves
 
-def avoid_body(possible_moves: dict, body: list):
-    """ Removes the moves that will collide with self """
-    moves_to_remove = []
-    for move in possible_moves:
-        if possible_moves[move] in body:
-            moves_to_remove.append(move)
+def get_occupied(snakes: list) -> set:
+    """ Builds the set of (x, y) cells occupied by any snake, to be shared by the collision filters """
+    return {(body["x"], body["y"]) for snake in snakes for body in snake["body"]}
 
-    for move in moves_to_remove:
-        if move in possible_moves:
-            del possible_moves[move]
+def remove_occupied(possible_moves: dict, occupied: set):
+    """ Removes the moves that land on an occupied cell """
+    for move in [m for m, c in possible_moves.items() if (c["x"], c["y"]) in occupied]:
+        del possible_moves[move]
 
     return possible_moves
 
-def avoid_snakes(possible_moves: dict, snakes: dict):
-    """ Removes the moves that will collide with other snakes """
-    moves_to_remove = []
-    for snake in snakes:
-        for move in possible_moves:
-            if possible_moves[move] in snake["body"]:
-                moves_to_remove.append(move)
-
-    for move in moves_to_remove:
-        if move in possible_moves:
-            del possible_moves[move]
+def avoid_body(possible_moves: dict, body: list):
+    """ Removes the moves that will collide with self """
+    return remove_occupied(possible_moves, {(b["x"], b["y"]) for b in body})
 
-    return possible_moves
+def avoid_snakes(possible_moves: dict, snakes: list, occupied: set = None):
+    """ Removes the moves that will collide with other snakes """
+    if occupied is None:
+        occupied = get_occupied(snakes)
+    return remove_occupied(possible_moves, occupied)
 
-def create_board(snakes, width, height):
+def create_board(snakes: list, width: int, height: int, gamemode: str = "standard", tails_move: bool = False) -> Board:
     """ Create a board representation """
-    board = [[1 for _ in range(width)] for _ in range(height)]
-    for snake in snakes:
-        for body in snake["body"]:
-            board[height - body["y"] - 1][body["x"]] = 0
-    return board
+    return Board.from_snakes(snakes, width, height, gamemode, tails_move)
     
-def print_board(board):
+def print_board(board: Board):
     print("---")
-    for row in board:
-        print(''.join([str(x) for x in row]))
+    print(board)
     print("---")
 
-def get_closer_to_food(possible_moves: dict, food: list, board: list, gamemode: str):
-    """ Find the move that gets the snake closest to food """
-    width, height = len(board[0]), len(board)
-    stack, added = [], []
-    food = [(f["x"], f["y"]) for f in food]
-    for move in possible_moves:
-        stack.append((possible_moves[move]["x"], possible_moves[move]["y"], move))
-
-    while stack:
-        current_x, current_y, initial_dir = stack.pop(0)
-        if (current_x, current_y) in food: return initial_dir
-        for x, y in [(1,0), (-1,0), (0,1), (0,-1)]:
-
-            coordinates = convert_coordinates_wrapped_mode({"x": current_x + x, "y": current_y + y}, width, height, gamemode)
-            dx, dy = coordinates["x"], coordinates["y"]
-
-            if (dx, dy) in food: return initial_dir
-            if not(0 <= dx < width and 0 <= dy < height): continue
-            if board[height-1-dy][dx] and (dx, dy) not in added:
-                added.append((dx,dy))
-                stack.append((dx, dy, initial_dir))
+def get_closer_to_food(possible_moves: dict, food: list, board: Board, distances: DistanceMap = None, timing: TimeMap = None,
+                       costs: array = None, health: int = None):
+    """
+    Find the move that gets the snake closest to food.
+    A full distance map computed from possible_moves can be given to avoid searching again,
+    and with a timing, paths can go through the bodies that will have moved away by then.
+    With the health cost of every cell (see games.Game.costs), the move keeping the most health
+    on the way to food is chosen instead, among the moves that get there alive.
+    """
+    if not food: return None
+    if costs is not None:
+        reached = {move: found for move, found in cheapest_food(board, possible_moves, costs, health, food, timing).items() if found}
+        return max(reached, key=lambda move: reached[move][1]) if reached else None
+    if distances is None:
+        targets = target_mask(board, food)
+        if timing is None: distances = bfs(board, possible_moves, targets)
+        else: distances = timed_bfs(board, possible_moves, timing, targets, start=1)
+        cell = distances.found
+    else:
+        cell = distances.nearest(board.index(f) for f in food)
+    return None if cell is None else distances.origin(cell)
+
+def avoid_hazards(possible_moves: dict, costs: array, health: int, food: list, board: Board) -> dict:
+    """ Removes the moves into hazards that would kill the snake, unless it eats there or all of them do """
+    food_cells = {board.index(f) for f in food}
+    alive = {move: cell for move, cell in possible_moves.items() if costs[cell] < health or cell in food_cells}
+    return alive or possible_moves
+
+def avoid_small_territories(possible_moves: dict, territories: dict, length: int):
+    """ Removes the moves that control fewer cells than the snake needs to fit, unless all of them do """
+    roomy = {move: cell for move, cell in possible_moves.items() if territories[move] >= length}
+    if roomy: return roomy
+    if not possible_moves: return possible_moves
+    best = max(territories[move] for move in possible_moves)
+    return {move: cell for move, cell in possible_moves.items() if territories[move] == best}
 
 def avoid_head_to_head(possible_moves: dict, snakes: list, length: int, id: str, gamemode: str, width: int, height: int):
     """ Avoids the collision head to head with stronger snakes """
@@ -110,40 +134,122 @@ def avoid_head_to_head(possible_moves: dict, snakes: list, length: int, id: str,
 
     return possible_moves
 
-def choose_move(data: dict) -> str:
+def choose_engine(data: dict, strategy: str = None) -> str:
+    """ Search engine used for the request: MCTS for crowded standard and royale games, minimax otherwise """
+    if strategy is None: strategy = STRATEGY
+    if strategy != "auto": return strategy
+    crowded = len(data["board"]["snakes"]) > 2
+    return "mcts" if crowded and data["game"]["ruleset"]["name"] in MCTS_RULESETS else "search"
+
+def start_game(data: dict):
+    """ Called when a game starts, prepares what is kept across its turns """
+    games.store.get(data)
+
+def end_game(data: dict):
+    """ Called when a game ends, releases everything kept for it """
+    games.store.end(data)
+
+def run_engine(engine: str, data: dict, moves: list, started: float, game: games.Game, state: GameState):
+    """ Searches the candidate moves with the given engine, over the worker processes when they are running """
+    if engine == "mcts" and parallel.is_running():
+        return parallel.search_mcts(data, moves, started, game)
+    if engine == "mcts":
+        return mcts.search(data, moves, started, game, state)
+    if parallel.is_running():
+        return parallel.search(data, moves, started, game)
+    return search.search(data, moves, started, game, state)
+
+def choose_move(data: dict, started: float = None, state: GameState = None, strategy: str = None, endgame_nodes: int = None) -> str:
     """
     For a full example of 'data', see https://docs.battlesnake.com/references/api/sample-move-request
+    started is the perf_counter time the request arrived at, used for the search time budget,
+    and state the compact state of the request when it was already parsed (see parsing.py).
+    strategy overrides SNAKE_STRATEGY, e.g. to compare strategies against each other.
+    endgame_nodes caps the space filling search, only bounded by the deadline otherwise (see endgame.py).
+    A safe move is chosen first and answers if the endgame, book or search misses its deadline (see watchdog.py).
     """
-    
-    gamemode = data["game"]["ruleset"]["name"]
+    if started is None: started = time.perf_counter()
 
     my_head = data["you"]["head"]  # A dictionary of x/y coordinates like {"x": 0, "y": 0}
-    my_body = data["you"]["body"]  # A list of x/y coordinate dictionaries like [ {"x": 0, "y": 0}, {"x": 1, "y": 0}, {"x": 2, "y": 0} ]
     my_length = data["you"]["length"]
     my_id = data["you"]["id"]
-    
-    board_width = data["board"]["width"]
-    board_height = data["board"]["height"]
     snakes = data["board"]["snakes"]
     food = data["board"]["food"]
-    
-    possible_moves = generate_possible_moves(my_head, gamemode, board_width, board_height)
-
-    board = create_board(snakes, board_width, board_height)
-
-    if gamemode != "wrapped":
-        possible_moves = avoid_walls(possible_moves, board_width, board_height)
-    
-    possible_moves = avoid_body(possible_moves, my_body)
-    possible_moves = avoid_snakes(possible_moves, snakes)
-    
-    possible_moves = avoid_head_to_head(possible_moves, snakes, my_length, my_id, gamemode, board_width, board_height)
-
-    move = get_closer_to_food(possible_moves, food, board, gamemode)
+    my_health = data["you"]["health"]
+
+    # Single occupancy index shared by every collision filter, the food search and the game store,
+    # built from the compact state where the bodies already are cell indices
+    with metrics.span("board"):
+        if state is None: state = GameState.from_data(data)
+        board = state.occupancy()
+
+    game = games.store.turn(data, board)
+    # Health cost of every cell, kept by the game, when there are hazards to walk around
+    costs = game.costs if game.hazards else None
+
+    with metrics.span("avoid_blocked"):
+        possible_moves = board.generate_possible_moves(board.index(my_head))
+        possible_moves = board.avoid_blocked(possible_moves)
+    with metrics.span("avoid_head_to_head"):
+        # Cells the opponents were seen never to move to in their current pattern are not a threat
+        unlikely = game.model.unlikely_cells(board, game.heads)
+        possible_moves = board.avoid_head_to_head(possible_moves, snakes, my_length, my_id, unlikely)
+    if costs is not None:
+        with metrics.span("avoid_hazards"):
+            possible_moves = avoid_hazards(possible_moves, costs, my_health, food, board)
+
+    with metrics.span("territory"):
+        # Space is counted in the time dimension, bodies free their cells as they move on
+        timing = TimeMap.from_state(state, my_id)
+        territories = evaluation.territory_by_move(board, possible_moves, snakes, my_id, timing)
+        possible_moves = avoid_small_territories(possible_moves, territories, my_length)
+
+    with metrics.span("food"):
+        move = get_closer_to_food(possible_moves, food, board, timing=timing, costs=costs, health=my_health)
 
     if move == None:
         move = "up"
         if len(possible_moves) > 0:
-            move = random.choice(list(possible_moves.keys()))
-
+            if costs is not None:
+                cheapest = min(costs[cell] for cell in possible_moves.values())
+                move = random.choice([m for m, cell in possible_moves.items() if costs[cell] == cheapest])
+            else:
+                move = random.choice(list(possible_moves.keys()))
+
+    engine = choose_engine(data, strategy)
+
+    def deliberate(safe: str) -> str:
+        """ Every stage that can search, given the safe move found above and returning the move to play """
+        # Sealed off from every opponent, only the length of the path left matters
+        with metrics.span("endgame"):
+            region = endgame.isolated_region(board, possible_moves, snakes, my_id, timing)
+            fill = None
+            if region is not None:
+                fill = endgame.solve(board, possible_moves, region, timing, board.index(my_head),
+                                     search.get_deadline(data, started, game), my_health, endgame_nodes)
+        if fill is not None:
+            # Unless the snake would starve on the way and food is there to be eaten
+            starving = fill.length >= my_health and any(timing.food[cell] for cell in region)
+            return safe if starving else fill.move
+        # Opening positions were searched deeper offline than a turn allows
+        book_move = opening_book.lookup(data, state)
+        if book_move in possible_moves: return book_move
+        if engine == "greedy": return safe
+        # The food move is searched first so it is kept if the search runs out of time
+        moves = sorted(possible_moves, key=lambda m: m != safe)
+        with metrics.span("search"):
+            result = run_engine(engine, data, moves, started, game, state)
+        metrics.observe("battlesnake_search_nodes", result.nodes, engine=engine)
+        metrics.observe("battlesnake_deadline_margin_seconds", search.get_deadline(data, started, game) - time.perf_counter(), engine=engine)
+        return result.move
+
+    if len(possible_moves) > 1:
+        chosen = watchdog.run(lambda: deliberate(move), watchdog.get_deadline(data, started, game))
+        if chosen is None:
+            # The safe move computed above answers when the endgame, book or search is late or failed
+            print(f"{data['game']['id']} turn {data['turn']} {engine} missed the deadline")
+        else:
+            move = chosen
+
+    game.elapsed = (time.perf_counter() - started) * 1000
     return move
\ No newline at end of file
@@ -0,0 +1,204 @@
+import random
+import time
+import uuid
+
+from board import Board, MOVES
+from rules import MAX_HEALTH, DEFAULT_HAZARD_DAMAGE, GameState, Snake, step
+
+RULESETS = ("standard", "wrapped", "royale", "constrictor", "duel")
+START_LENGTH = 3
+# Nodes the endgame search of simulated snakes stops at (about 8 ms), so a seeded game replays the same on
+# any machine and self-play is not spent filling regions: the search is most of a turn without a cap
+ENDGAME_NODES = 200
+
+class Ruleset:
+    """ Settings of an official ruleset, as sent in the game object """
+
+    def __init__(self, name: str, food_spawn_chance: int = 15, minimum_food: int = 1,
+                 hazard_damage: int = DEFAULT_HAZARD_DAMAGE, shrink_every: int = 0):
+        self.name = name
+        self.food_spawn_chance, self.minimum_food = food_spawn_chance, minimum_food
+        self.hazard_damage, self.shrink_every = hazard_damage, shrink_every
+
+    @classmethod
+    def get(cls, name: str) -> "Ruleset":
+        if name not in RULESETS: raise ValueError(f"Unknown ruleset {name}")
+        if name == "royale": return cls(name, shrink_every=25)
+        if name == "constrictor": return cls(name, food_spawn_chance=0, minimum_food=0)
+        return cls(name)
+
+    @property
+    def gamemode(self) -> str:
+        """ Name sent to the snakes: duels are standard games with two snakes """
+        return "standard" if self.name == "duel" else self.name
+
+    def settings(self) -> dict:
+        return {
+            "foodSpawnChance": self.food_spawn_chance, "minimumFood": self.minimum_food,
+            "hazardDamagePerTurn": self.hazard_damage,
+            "royale": {"shrinkEveryNTurns": self.shrink_every}
+        }
+
+def uses_fixed_spawns(width: int, height: int, count: int) -> bool:
+    return width >= 7 and height >= 7 and count <= 8
+
+def start_points(width: int, height: int) -> tuple:
+    """ (corners, sides) (x, y) of the official fixed spawn positions """
+    low, mid_x, mid_y, high_x, high_y = 1, (width - 1) // 2, (height - 1) // 2, width - 2, height - 2
+    return [(low, low), (low, high_y), (high_x, low), (high_x, high_y)], [(low, mid_y), (mid_x, low), (high_x, mid_y), (mid_x, high_y)]
+
+def center_cell(width: int, height: int) -> int:
+    return (height - 1) // 2 * width + (width - 1) // 2
+
+def places_food_by_snakes(width: int, height: int, count: int) -> bool:
+    """ Small boards only get food by the snakes for up to 4 of them, the center food is always placed """
+    return count <= 4 or width * height >= 11 * 11
+
+def food_options(width: int, height: int, head: int, food: set) -> list:
+    """
+    Cells where the official rules may place the starting food of a snake: diagonal to its head,
+    farther than the head from the center on at least one axis, and never in the center or a corner
+    """
+    x, y = head % width, head // width
+    center_x, center_y = (width - 1) // 2, (height - 1) // 2
+    options = []
+    for fx, fy in ((x - 1, y - 1), (x - 1, y + 1), (x + 1, y - 1), (x + 1, y + 1)):
+        if not (0 <= fx < width and 0 <= fy < height) or (fx, fy) == (center_x, center_y): continue
+        if fy * width + fx in food: continue
+        away = fx < x < center_x or center_x < x < fx or fy < y < center_y or center_y < y < fy
+        corner = fx in (0, width - 1) and fy in (0, height - 1)
+        if away and not corner: options.append(fy * width + fx)
+    return options
+
+class GameResult:
+    """ Outcome of a simulated game """
+    __slots__ = ("winner", "turns", "survived", "latencies")
+
+    def __init__(self, winner: str, turns: int, survived: dict, latencies: dict):
+        self.winner, self.turns, self.survived, self.latencies = winner, turns, survived, latencies
+
+class Game:
+    """ A game played in process, turn by turn, following an official ruleset """
+
+    def __init__(self, snake_ids: list, ruleset: str = "standard", width: int = 11, height: int = 11, seed: int = None, timeout: int = 500,
+                 id: str = None):
+        self.ruleset = Ruleset.get(ruleset)
+        if self.ruleset.name == "duel" and len(snake_ids) != 2: raise ValueError("Duels are played by two snakes")
+        self.rng = random.Random(seed)
+        # Never derived from the seed: a replayed game must not find the state the server kept for the first one
+        self.id, self.timeout = id or f"simulated-{uuid.uuid4().hex}", timeout
+        board = Board(width, height, self.ruleset.gamemode)
+        # Coordinates are built once and shared by every request of the game
+        self.coordinates = [board.coordinates(cell) for cell in range(board.size)]
+        self.safe_zone = [0, width - 1, 0, height - 1]
+
+        snakes = [Snake(id, [cell] * START_LENGTH, MAX_HEALTH) for id, cell in zip(snake_ids, self.spawn_positions(board, len(snake_ids)))]
+        self.state = GameState(board, snakes, set(), frozenset(), self.ruleset.hazard_damage, 0)
+        if self.ruleset.minimum_food or self.ruleset.food_spawn_chance:
+            self.place_initial_food()
+
+    def spawn_positions(self, board: Board, count: int) -> list:
+        """ Official fixed positions (corners or sides first, at random) when they fit, random even cells otherwise """
+        width = board.width
+        if uses_fixed_spawns(width, board.height, count):
+            corners, sides = start_points(width, board.height)
+            self.rng.shuffle(corners)
+            self.rng.shuffle(sides)
+            points = corners + sides if self.rng.randrange(2) == 0 else sides + corners
+            return [y * width + x for x, y in points[:count]]
+        cells = [c for c in range(board.size) if (c % width + c // width) % 2 == 0]
+        return self.rng.sample(cells, count)
+
+    def place_initial_food(self):
+        """ One food diagonal to every snake, as the official rules place it (see food_options), and one in the center """
+        board, food = self.state.board, self.state.food
+        if places_food_by_snakes(board.width, board.height, len(self.state.snakes)):
+            for snake in self.state.snakes:
+                options = food_options(board.width, board.height, snake.head, food)
+                if options: food.add(self.rng.choice(options))
+        center = center_cell(board.width, board.height)
+        if all(center not in s.body for s in self.state.snakes):
+            food.add(center)
+
+    def spawn_food(self):
+        state, ruleset = self.state, self.ruleset
+        missing = ruleset.minimum_food - len(state.food)
+        if missing <= 0 and self.rng.randrange(100) < ruleset.food_spawn_chance:
+            missing = 1
+        if missing <= 0: return
+        occupied = {cell for s in state.snakes if s.alive for cell in s.body} | state.food
+        free = [c for c in range(state.board.size) if c not in occupied]
+        state.food.update(self.rng.sample(free, min(missing, len(free))))
+
+    def shrink(self):
+        """ Royale: every shrink_every turns a random side of the safe zone becomes hazard """
+        state, zone = self.state, self.safe_zone
+        if not self.ruleset.shrink_every or state.turn % self.ruleset.shrink_every: return
+        if zone[0] > zone[1] or zone[2] > zone[3]: return
+        side = self.rng.randrange(4)
+        if side == 0: zone[0] += 1
+        elif side == 1: zone[1] -= 1
+        elif side == 2: zone[2] += 1
+        else: zone[3] -= 1
+        width = state.board.width
+        state.hazards = frozenset(c for c in range(state.board.size)
+                                  if not (zone[0] <= c % width <= zone[1] and zone[2] <= c // width <= zone[3]))
+
+    def is_over(self) -> bool:
+        alive = sum(1 for s in self.state.snakes if s.alive)
+        return alive == 0 or (alive == 1 and len(self.state.snakes) > 1)
+
+    def snake_data(self, snake: Snake) -> dict:
+        coordinates = self.coordinates
+        body = [coordinates[cell] for cell in snake.body]
+        return {"id": snake.id, "name": snake.id, "health": snake.health, "body": body, "head": body[0],
+                "length": len(body), "latency": "0", "shout": ""}
+
+    def request(self, you: str) -> dict:
+        """ The /move request the given snake would receive this turn """
+        state, coordinates = self.state, self.coordinates
+        snakes = [self.snake_data(s) for s in state.snakes if s.alive]
+        return {
+            "game": {"id": self.id, "ruleset": {"name": self.ruleset.gamemode, "version": "simulator", "settings": self.ruleset.settings()}, "timeout": self.timeout},
+            "turn": state.turn,
+            "board": {
+                "width": state.board.width, "height": state.board.height, "snakes": snakes,
+                "food": [coordinates[c] for c in state.food],
+                "hazards": [coordinates[c] for c in state.hazards]
+            },
+            "you": next(s for s in snakes if s["id"] == you)
+        }
+
+    def play_turn(self, snakes: dict, latencies: dict):
+        """ Asks every alive snake for its move and applies them """
+        moves = {}
+        for snake in self.state.snakes:
+            if not snake.alive: continue
+            started = time.perf_counter()
+            move = snakes[snake.id](self.request(snake.id))
+            latencies[snake.id].append(time.perf_counter() - started)
+            # An invalid answer makes the engine move the snake up
+            moves[snake.id] = MOVES.index(move) if move in MOVES else 0
+        step(self.state, moves)
+        self.spawn_food()
+        self.shrink()
+
+    def play(self, snakes: dict, max_turns: int = None) -> GameResult:
+        """ Plays until one snake is left (or none in solo games), calling snakes[id](data) -> move every turn """
+        survived = {id: 0 for id in snakes}
+        latencies = {id: [] for id in snakes}
+        while not self.is_over() and (max_turns is None or self.state.turn < max_turns):
+            self.play_turn(snakes, latencies)
+            for snake in self.state.snakes:
+                if snake.alive: survived[snake.id] = self.state.turn
+
+        alive = [s.id for s in self.state.snakes if s.alive]
+        winner = alive[0] if len(alive) == 1 else None
+        return GameResult(winner, self.state.turn, survived, latencies)
+
+def play(snakes: dict, ruleset: str = "standard", width: int = 11, height: int = 11, seed: int = None, max_turns: int = None, timeout: int = 500) -> GameResult:
+    """ Plays a game between snakes given as {id: callable(data) -> move} """
+    if seed is not None:
+        # Strategies draw from the global generator, seed it too so the game can be replayed
+        random.seed(seed)
+    return Game(list(snakes), ruleset, width, height, seed, timeout).play(snakes, max_turns)
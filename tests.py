@@ -10,9 +10,75 @@ in the folder where this file exists:
     python tests.py -v
 
 """
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import unittest
 
 import server_logic
+from board import Board, MOVES, OUTSIDE
+from pathfinding import UNREACHABLE, TimeMap, bfs, cheapest_food, timed_bfs, voronoi
+from rules import GameState, step
+import mcts
+import opening_book
+import opponents
+import metrics
+import parallel
+import search
+import simulator
+import tournament
+import benchmark
+import endgame
+import evaluation
+import games
+import get_ranking
+import parsing
+import profiler
+import replay
+import transposition
+import watchdog
+
+def make_snake(id: str, body: list, health: int = 100) -> dict:
+    """ Builds a snake as sent by the engine from a list of (x, y) tuples """
+    body = [{"x": x, "y": y} for x, y in body]
+    return {"id": id, "name": id, "health": health, "body": body, "head": body[0], "length": len(body), "latency": "0", "shout": ""}
+
+def make_data(snakes: list, food: list = (), width: int = 11, height: int = 11, gamemode: str = "standard", hazards: list = (), turn: int = 0) -> dict:
+    """ Builds a move request where the first snake is "you" """
+    return {
+        "game": {"id": "game", "ruleset": {"name": gamemode, "version": "v1.0.0"}, "timeout": 500},
+        "turn": turn,
+        "board": {
+            "width": width, "height": height, "snakes": snakes,
+            "food": [{"x": x, "y": y} for x, y in food],
+            "hazards": [{"x": x, "y": y} for x, y in hazards]
+        },
+        "you": snakes[0]
+    }
+
+def simulated_move(data: dict) -> str:
+    """ choose_move with the endgame search capped, so seeded games replay the same """
+    return server_logic.choose_move(data, endgame_nodes=simulator.ENDGAME_NODES)
+
+def pocket_snakes() -> list:
+    """ On a 5x5 board, "you" can turn left into a pocket smaller than itself (held by "wall") or right into open space """
+    you = make_snake("you", [(1, 3), (1, 4), (2, 4), (3, 4), (4, 4), (4, 3)])
+    wall = make_snake("wall", [(0, 2), (1, 2), (2, 2), (2, 1), (2, 1)])
+    return [you, wall]
+
+def make_pocket(timeout: int = 500, turn: int = 0) -> dict:
+    """ Move request of pocket_snakes(), with food in the pocket as bait: "right" is the only good move """
+    data = make_data(pocket_snakes(), food=[(0, 3)], width=5, height=5, turn=turn)
+    data["game"]["timeout"] = timeout
+    return data
+
+def always_up(data: dict) -> str:
+    """ Strategy used as a weak opponent """
+    return "up"
 
 class ConvertCoordinatesWrappedTest(unittest.TestCase):
     def test_other_mode(self):
@@ -358,6 +424,24 @@ class AvoidSnakesTest(unittest.TestCase):
         self.assertTrue("left" not in possible_moves)
         self.assertTrue("right" in possible_moves)
 
+    def test_shared_occupancy(self):
+        """ A precomputed occupancy index should give the same result """
+
+        # Arrange
+        test_head = {"x": 4, "y": 4}
+        test_snakes = [{"body": [{"x": 3, "y": 4}, {"x": 3, "y": 3}]}, {"body": [{"x": 4, "y": 5}, {"x": 5, "y": 5}]}]
+        gamemode = "standard"
+        width, height = 11, 11
+
+        possible_moves = server_logic.generate_possible_moves(test_head, gamemode, width, height)
+        occupied = server_logic.get_occupied(test_snakes)
+
+        # Act
+        possible_moves = server_logic.avoid_snakes(possible_moves, test_snakes, occupied)
+
+        # Assert
+        self.assertEqual(set(possible_moves), {"down", "right"})
+
 class AvoidSnakesHead(unittest.TestCase):
     def test_avoid_collision(self):
         """ It should not move to square in the middle """
@@ -403,5 +487,1565 @@ class AvoidSnakesHead(unittest.TestCase):
         self.assertTrue("left" in possible_moves)
         self.assertTrue("right" in possible_moves)
 
+class BoardTest(unittest.TestCase):
+    def test_neighbours_standard(self):
+        """ Moves leaving the board should be marked as outside """
+
+        # Arrange
+        board = Board(11, 11, "standard")
+
+        # Act
+        possible_moves = board.generate_possible_moves(board.index({"x": 0, "y": 10}))
+
+        # Assert
+        self.assertEqual(possible_moves["up"], OUTSIDE)
+        self.assertEqual(possible_moves["left"], OUTSIDE)
+        self.assertEqual(board.coordinates(possible_moves["down"]), {"x": 0, "y": 9})
+        self.assertEqual(board.coordinates(possible_moves["right"]), {"x": 1, "y": 10})
+
+    def test_neighbours_wrapped(self):
+        """ Moves leaving the board should wrap to the other side """
+
+        # Arrange
+        board = Board(11, 11, "wrapped")
+
+        # Act
+        possible_moves = board.generate_possible_moves(board.index({"x": 0, "y": 10}))
+
+        # Assert
+        self.assertEqual(board.coordinates(possible_moves["up"]), {"x": 0, "y": 0})
+        self.assertEqual(board.coordinates(possible_moves["left"]), {"x": 10, "y": 10})
+
+    def test_avoid_blocked(self):
+        """ Should remove walls and snake bodies in a single pass """
+
+        # Arrange
+        test_snakes = [{"body": [{"x": 0, "y": 4}, {"x": 1, "y": 4}, {"x": 1, "y": 3}]}]
+        board = Board.from_snakes(test_snakes, 11, 11, "standard")
+        possible_moves = board.generate_possible_moves(board.index({"x": 0, "y": 4}))
+
+        # Act
+        possible_moves = board.avoid_blocked(possible_moves)
+
+        # Assert
+        self.assertEqual(set(possible_moves), {"up", "down"})
+
+    def test_tail_will_move(self):
+        """ The tail should be free unless the snake has just eaten """
+
+        # Arrange
+        moving = {"body": [{"x": 4, "y": 4}, {"x": 4, "y": 3}, {"x": 4, "y": 2}]}
+        stacked = {"body": [{"x": 6, "y": 4}, {"x": 6, "y": 3}, {"x": 6, "y": 3}]}
+
+        # Act
+        board = Board.from_snakes([moving, stacked], 11, 11, "standard", tails_move=True)
+
+        # Assert
+        self.assertTrue(board.is_free(board.index({"x": 4, "y": 2})))
+        self.assertFalse(board.is_free(board.index({"x": 4, "y": 3})))
+        self.assertFalse(board.is_free(board.index({"x": 6, "y": 3})))
+
+    def test_avoid_head_to_head(self):
+        """ Should avoid the squares reachable by longer snakes """
+
+        # Arrange
+        board = Board(11, 11, "standard")
+        test_snakes = [{"id": "2", "head": {"x": 2, "y": 4}, "length": 3}]
+        possible_moves = board.generate_possible_moves(board.index({"x": 4, "y": 4}))
+
+        # Act
+        possible_moves = board.avoid_head_to_head(possible_moves, test_snakes, 3, "1")
+
+        # Assert
+        self.assertEqual(set(possible_moves), {"up", "down", "right"})
+
+class GetCloserToFoodTest(unittest.TestCase):
+    def test_move_towards_food(self):
+        """ Should pick the move on the shortest path to the food """
+
+        # Arrange
+        test_snakes = [{"body": [{"x": 4, "y": 4}, {"x": 4, "y": 3}, {"x": 4, "y": 2}]}]
+        board = server_logic.create_board(test_snakes, 11, 11)
+        possible_moves = board.avoid_blocked(board.generate_possible_moves(board.index({"x": 4, "y": 4})))
+
+        # Act
+        move = server_logic.get_closer_to_food(possible_moves, [{"x": 1, "y": 4}], board)
+
+        # Assert
+        self.assertEqual(move, "left")
+
+    def test_no_food(self):
+        """ Should return None when no food is reachable """
+
+        # Arrange
+        board = server_logic.create_board([], 11, 11)
+        possible_moves = board.generate_possible_moves(board.index({"x": 4, "y": 4}))
+
+        # Act
+        move = server_logic.get_closer_to_food(possible_moves, [], board)
+
+        # Assert
+        self.assertIsNone(move)
+
+    def test_reuse_distance_map(self):
+        """ A precomputed distance map should give the same move """
+
+        # Arrange
+        test_snakes = [{"body": [{"x": 4, "y": 4}, {"x": 4, "y": 3}, {"x": 4, "y": 2}]}]
+        board = server_logic.create_board(test_snakes, 11, 11)
+        possible_moves = board.avoid_blocked(board.generate_possible_moves(board.index({"x": 4, "y": 4})))
+        distances = bfs(board, possible_moves)
+
+        # Act
+        move = server_logic.get_closer_to_food(possible_moves, [{"x": 8, "y": 4}], board, distances)
+
+        # Assert
+        self.assertEqual(move, "right")
+
+class BfsTest(unittest.TestCase):
+    def test_distances(self):
+        """ Should compute the distance to every reachable cell """
+
+        # Arrange
+        test_snakes = [{"body": [{"x": 1, "y": 0}, {"x": 1, "y": 1}, {"x": 0, "y": 1}]}]
+        board = server_logic.create_board(test_snakes, 5, 5)
+
+        # Act
+        distances = bfs(board, {"head": board.index({"x": 2, "y": 0})})
+
+        # Assert
+        self.assertEqual(distances.distance(board.index({"x": 4, "y": 4})), 6)
+        self.assertEqual(distances.distance(board.index({"x": 0, "y": 0})), UNREACHABLE)
+        self.assertEqual(distances.reachable(), 21)
+        self.assertEqual(distances.origin(board.index({"x": 3, "y": 3})), "head")
+
+class VoronoiTest(unittest.TestCase):
+    def test_split_board(self):
+        """ Two equal snakes facing each other should split the board, leaving the middle column contested """
+
+        # Arrange
+        board = Board(5, 5, "standard")
+        sources = [(board.index({"x": 0, "y": 2}), 3, 0), (board.index({"x": 4, "y": 2}), 3, 0)]
+
+        # Act
+        counts = voronoi(board, sources)
+
+        # Assert
+        self.assertEqual(counts, [10, 10])
+
+    def test_longer_snake_wins_ties(self):
+        """ Cells reached at the same time should go to the longer snake """
+
+        # Arrange
+        board = Board(5, 5, "standard")
+        sources = [(board.index({"x": 0, "y": 2}), 3, 0), (board.index({"x": 4, "y": 2}), 4, 0)]
+
+        # Act
+        counts = voronoi(board, sources)
+
+        # Assert
+        self.assertEqual(counts, [10, 15])
+
+class AvoidSmallTerritoriesTest(unittest.TestCase):
+    def test_avoid_dead_end(self):
+        """ Should not enter a pocket smaller than itself """
+
+        # Arrange
+        possible_moves = {"up": 1, "left": 2, "right": 3}
+        territories = {"up": 40, "left": 3, "right": 12}
+
+        # Act
+        possible_moves = server_logic.avoid_small_territories(possible_moves, territories, 10)
+
+        # Assert
+        self.assertEqual(set(possible_moves), {"up", "right"})
+
+    def test_keep_largest(self):
+        """ When every move is too small, should keep the largest one """
+
+        # Arrange
+        possible_moves = {"up": 1, "left": 2}
+        territories = {"up": 4, "left": 3}
+
+        # Act
+        possible_moves = server_logic.avoid_small_territories(possible_moves, territories, 10)
+
+        # Assert
+        self.assertEqual(set(possible_moves), {"up"})
+
+class ChooseMoveTest(unittest.TestCase):
+    def test_avoid_dead_end(self):
+        """ Should not enter a pocket smaller than itself even if food is there """
+
+        # Arrange
+        data = make_pocket()
+
+        # Act
+        move = server_logic.choose_move(data)
+
+        # Assert
+        self.assertEqual(move, "right")
+
+class StepTest(unittest.TestCase):
+    def test_eat_and_grow(self):
+        """ Eating should restore health and grow the tail """
+
+        # Arrange
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)], health=50)
+        state = GameState.from_data(make_data([you], food=[(1, 2)]))
+
+        # Act
+        step(state, {"you": 0})
+
+        # Assert
+        snake = state.snake("you")
+        self.assertTrue(snake.alive)
+        self.assertEqual(snake.health, 100)
+        self.assertEqual(snake.length, 4)
+        self.assertEqual(state.food, set())
+
+    def test_head_to_head(self):
+        """ The shorter snake should die in a head to head collision """
+
+        # Arrange
+        you = make_snake("you", [(2, 2), (1, 2), (0, 2)])
+        other = make_snake("other", [(4, 2), (5, 2), (6, 2), (7, 2)])
+        state = GameState.from_data(make_data([you, other]))
+
+        # Act
+        step(state, {"you": 3, "other": 2})
+
+        # Assert
+        self.assertFalse(state.snake("you").alive)
+        self.assertTrue(state.snake("other").alive)
+
+    def test_wall(self):
+        """ Leaving the board should eliminate the snake """
+
+        # Arrange
+        you = make_snake("you", [(0, 2), (1, 2), (2, 2)])
+        state = GameState.from_data(make_data([you]))
+
+        # Act
+        step(state, {"you": 2})
+
+        # Assert
+        self.assertFalse(state.snake("you").alive)
+
+class SearchTest(unittest.TestCase):
+    def test_avoid_dead_end(self):
+        """ The search should see the pocket is a dead end """
+
+        # Arrange
+        data = make_pocket(timeout=200)
+
+        # Act
+        result = search.search(data, ["left", "right"])
+
+        # Assert
+        self.assertEqual(result.move, "right")
+        self.assertGreater(result.depth, 0)
+
+    def test_respects_deadline(self):
+        """ Should answer before the game timeout """
+
+        # Arrange
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        other = make_snake("other", [(9, 9), (9, 10), (10, 10)])
+        data = make_data([you, other], food=[(5, 5)])
+        data["game"]["timeout"] = 200
+
+        # Act
+        result = search.search(data, ["up", "right"])
+
+        # Assert
+        self.assertLess(result.elapsed, 0.2)
+        self.assertIn(result.move, ["up", "right"])
+
+class TranspositionTest(unittest.TestCase):
+    def test_hash_features(self):
+        """ The hash should depend on the position and health bucket only """
+
+        # Arrange
+        you = make_snake("you", [(5, 5), (5, 4), (5, 3)], health=95)
+        other = make_snake("other", [(1, 1), (1, 0), (0, 0)])
+        zobrist = transposition.get_zobrist(121)
+        state = GameState.from_data(make_data([you, other], food=[(3, 3)]))
+
+        # Act
+        same = state.copy()
+        same.snake("you").health = 99
+        hungrier = state.copy()
+        hungrier.snake("you").health = 50
+        moved = step(state.copy(), {"you": 0, "other": 0})
+
+        # Assert
+        self.assertEqual(zobrist.hash(state), zobrist.hash(same))
+        self.assertNotEqual(zobrist.hash(state), zobrist.hash(hungrier))
+        self.assertNotEqual(zobrist.hash(state), zobrist.hash(moved))
+
+    def test_bounded_size(self):
+        """ The table should never hold more entries than its capacity """
+
+        # Arrange
+        table = transposition.TranspositionTable(121, capacity=16)
+
+        # Act
+        for key in range(1000):
+            table.put(key, 1, 0, transposition.EXACT, 0)
+
+        # Assert
+        self.assertEqual(len(table), 16)
+        self.assertIsNone(table.get(3))
+        self.assertEqual(table.get(999), (1, 0, transposition.EXACT, 0))
+
+    def test_deeper_entries_kept(self):
+        """ Within a search, a shallower result should not replace a deeper one """
+
+        # Arrange
+        table = transposition.TranspositionTable(121, capacity=16)
+        table.put(1, 5, 10, transposition.EXACT, 0)
+
+        # Act
+        table.put(17, 2, 20, transposition.EXACT, 1)
+        kept = table.get(1)
+        table.new_search()
+        table.put(17, 2, 20, transposition.EXACT, 1)
+
+        # Assert
+        self.assertEqual(kept, (5, 10, transposition.EXACT, 0))
+        self.assertIsNone(table.get(1))
+        self.assertEqual(table.get(17), (2, 20, transposition.EXACT, 1))
+
+class MCTSTest(unittest.TestCase):
+    def test_avoid_dead_end(self):
+        """ Playouts entering the pocket should all die """
+
+        # Arrange
+        data = make_pocket(timeout=200)
+
+        # Act
+        result = mcts.search(data, ["left", "right"])
+
+        # Assert
+        self.assertEqual(result.move, "right")
+        self.assertGreater(result.nodes_per_second, 0)
+
+class ChooseEngineTest(unittest.TestCase):
+    def test_auto(self):
+        """ Should use MCTS for crowded standard games and minimax for duels """
+
+        # Arrange
+        snakes = [make_snake(str(i), [(i, 0), (i, 1)]) for i in range(4)]
+        crowded, duel = make_data(snakes), make_data(snakes[:2])
+        self.addCleanup(setattr, server_logic, "STRATEGY", server_logic.STRATEGY)
+        server_logic.STRATEGY = "auto"
+
+        # Act
+        engines = server_logic.choose_engine(crowded), server_logic.choose_engine(duel)
+
+        # Assert
+        self.assertEqual(engines, ("mcts", "search"))
+
+def worker_tables() -> int:
+    """ Run in a search worker: its table budget """
+    return games.store.max_tables
+
+class ParallelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        parallel.start_pool(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.stop_pool()
+
+    def test_root_parallel_search(self):
+        """ Each root move searched by its own worker should still avoid the pocket """
+
+        # Arrange
+        data = make_pocket(timeout=200)
+
+        # Act
+        result = parallel.search(data, ["left", "right"])
+        mcts_result = parallel.search_mcts(data, ["left", "right"])
+
+        # Assert
+        self.assertEqual(result.move, "right")
+        self.assertGreater(result.depth, 0)
+        self.assertEqual(mcts_result.move, "right")
+        self.assertLess(result.elapsed, 0.2)
+
+    def test_worker_state(self):
+        """ Workers should search with the parent's model and split the table budget between them """
+
+        # Arrange
+        data = make_pocket(timeout=200, turn=1)
+        game = games.GameStore().turn(data)
+
+        # Act
+        result = parallel.search(data, ["left", "right"], game=game)
+        tables = parallel._pool.submit(worker_tables).result()
+
+        # Assert
+        self.assertEqual(result.move, "right")
+        self.assertEqual(tables, games.MAX_TABLES // 2)
+
+class GameStoreTest(unittest.TestCase):
+    def test_observed_moves(self):
+        """ Should record the move every opponent played between two turns, once when a turn is seen twice """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(10, 10), (10, 9), (10, 8)])
+        game = store.turn(make_data([you, make_snake("other", [(1, 1), (1, 0), (0, 0)])], turn=1))
+        before = game.model.patterns["other"]
+
+        # Act
+        moved = make_data([you, make_snake("other", [(2, 1), (1, 1), (1, 0)])], turn=2)
+        store.turn(moved)
+        store.turn(moved)
+
+        # Assert
+        self.assertEqual(game.model.counts, {"other": {before: [0, 0, 0, 1]}})
+        self.assertEqual(game.heads, {"you": 120, "other": 13})
+
+    def test_hazards_cached(self):
+        """ The hazard layout should only be rebuilt when hazards change """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        game = store.turn(make_data([you], hazards=[(0, 5)], turn=1))
+        hazards = game.hazards
+
+        # Act
+        store.turn(make_data([you], hazards=[(0, 5)], turn=2))
+        same = game.hazards
+        store.turn(make_data([you], hazards=[(0, 5), (0, 6)], turn=3))
+
+        # Assert
+        self.assertIs(same, hazards)
+        self.assertEqual(game.hazards, {5 * 11, 6 * 11})
+
+    def test_hazard_costs(self):
+        """ Cells should cost the hazard damage while they are hazards """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        game = store.turn(make_data([you], hazards=[(0, 5), (0, 6)], turn=1))
+
+        # Act
+        store.turn(make_data([you], hazards=[(0, 6), (0, 7), (0, 8)], turn=2))
+
+        # Assert
+        self.assertEqual([game.costs[y * 11] for y in range(4, 10)], [1, 1, 15, 15, 15, 1])
+
+    def test_hazards_moved(self):
+        """ Costs should follow hazards that move without changing in number, or are listed twice """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        game = store.turn(make_data([you], hazards=[(0, 5), (0, 6)], turn=1))
+
+        # Act
+        store.turn(make_data([you], hazards=[(0, 6), (0, 7)], turn=2))
+        moved = [game.costs[y * 11] for y in range(5, 8)]
+        store.turn(make_data([you], hazards=[(0, 8), (0, 8)], turn=3))
+
+        # Assert
+        self.assertEqual(moved, [1, 15, 15])
+        self.assertEqual([game.costs[y * 11] for y in range(5, 9)], [1, 1, 1, 15])
+
+    def test_eviction(self):
+        """ Games should be dropped on end, when idle and past the maximum number of games """
+
+        # Arrange
+        store = games.GameStore(ttl=60, max_games=2)
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        requests = [make_data([you]) for _ in range(4)]
+        for i, data in enumerate(requests): data["game"]["id"] = str(i)
+
+        # Act
+        for data in requests: store.get(data)
+        store.end(requests[3])
+        kept = [game.id for game in store.games.values()]
+        store.evict(now=store.games[games.key(requests[2])].last_seen + 61)
+
+        # Assert
+        self.assertEqual(kept, ["2"])
+        self.assertEqual(len(store), 0)
+
+    def test_new_game_same_id(self):
+        """ A turn older than the last one seen should start a new game """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        first = store.turn(make_data([you], turn=5))
+
+        # Act
+        second = store.turn(make_data([you], turn=0))
+
+        # Assert
+        self.assertIsNot(second, first)
+        self.assertEqual(second.turn, 0)
+        self.assertIs(store.turn(make_data([you], turn=0)), second)
+
+    def test_new_board_same_id(self):
+        """ A request on another board should never be applied to the game kept for the id """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        small = store.turn(make_data([you], turn=1))
+
+        # Act
+        large = store.turn(make_data([make_snake("you", [(20, 20), (20, 19), (20, 18)])], width=25, height=25, turn=2))
+
+        # Assert
+        self.assertIsNot(large, small)
+        self.assertEqual((large.board.width, large.board.height), (25, 25))
+        self.assertEqual(large.heads, {"you": 20 * 25 + 20})
+
+    def test_concurrent_requests(self):
+        """ Threads sharing the store should never see it in an inconsistent state """
+
+        # Arrange
+        store = games.GameStore(ttl=0.001, max_games=8, max_tables=2)
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        errors = []
+
+        def play(thread: int):
+            try:
+                for turn in range(200):
+                    data = make_data([you], turn=turn)
+                    data["game"]["id"] = f"{thread}-{turn % 16}"
+                    store.turn(data)
+                    if turn % 5 == 0: store.end(data)
+            except Exception as error:
+                errors.append(error)
+
+        # Act
+        threads = [threading.Thread(target=play, args=(i,)) for i in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        # Assert
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(store.searched), 2)
+
+    def test_search_memory_bounded(self):
+        """ Only the games played last should keep their tables, every game its other state """
+
+        # Arrange
+        store = games.GameStore(max_tables=2)
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        requests = [make_data([you], turn=1) for _ in range(4)]
+        for i, data in enumerate(requests): data["game"]["id"] = str(i)
+
+        # Act
+        for data in requests: store.turn(data).get_table()
+        first = store.turn(requests[0])
+        first.get_table()
+
+        # Assert
+        self.assertEqual(len(store), 4)
+        self.assertEqual([game.table is not None for game in store.games.values()], [False, False, True, True])
+        self.assertEqual(first.heads, {"you": 12})
+
+    def test_tree_reuse(self):
+        """ MCTS should continue from the subtree of the moves actually played """
+
+        # Arrange
+        game = games.GameStore().turn(make_data([make_snake("you", [(5, 5), (5, 4), (5, 3)])], turn=1))
+        data = make_data([make_snake("you", [(5, 5), (5, 4), (5, 3)])], turn=1)
+        data["game"]["timeout"] = 200
+        mcts.search(data, ["up", "left", "right"], game=game)
+        subtree = game.tree.children[(0,)]
+
+        # Act
+        data = make_data([make_snake("you", [(5, 6), (5, 5), (5, 4)])], turn=2)
+        data["game"]["timeout"] = 200
+        mcts.search(data, ["up", "left", "right"], game=game)
+
+        # Assert
+        self.assertIs(game.tree, subtree)
+
+class ParseMoveTest(unittest.TestCase):
+    def test_lean_request(self):
+        """ Should keep only what the logic reads and build the compact state """
+
+        # Arrange
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        other = make_snake("other", [(5, 5), (5, 4), (5, 3)])
+        other["customizations"] = {"color": "#888888", "head": "default", "tail": "default"}
+        data = make_data([you, other], food=[(2, 2)], hazards=[(0, 10)])
+        raw = json.dumps(data).encode()
+
+        # Act
+        parsed = parsing.parse_move(raw)
+
+        # Assert
+        self.assertEqual(set(parsed.data["board"]["snakes"][1]), set(parsing.SNAKE_FIELDS))
+        self.assertEqual(parsed.data["you"]["latency"], "0")
+        self.assertEqual(parsed.state.snake("other").body, [60, 49, 38])
+        self.assertEqual(parsed.state.hazards, {110})
+        self.assertGreater(parsed.elapsed, 0)
+        self.assertEqual(server_logic.choose_move(parsed.data, state=parsed.state), server_logic.choose_move(data))
+
+    def test_malformed(self):
+        """ A body that is not a move request should raise a ValueError, answered with 400 """
+
+        # Act & Assert
+        for raw in (b"{", b"[]", b'{"game": {}}'):
+            with self.assertRaises(ValueError):
+                parsing.parse_move(raw)
+
+    def test_board_from_state(self):
+        """ The board and time map built from the compact state should match those built from the request """
+
+        # Arrange
+        snakes = [make_snake("you", [(1, 1), (1, 0), (0, 0)]), make_snake("other", [(5, 5), (5, 4), (5, 3), (5, 3)])]
+        data = make_data(snakes, food=[(5, 6), (2, 2)])
+        board = Board.from_data(data)
+        expected = TimeMap.from_snakes(board, snakes, "you", data["board"]["food"])
+
+        # Act
+        state = parsing.parse_move(json.dumps(data).encode()).state
+        timing = TimeMap.from_state(state, "you")
+
+        # Assert
+        self.assertEqual(state.occupancy().cells, board.cells)
+        self.assertEqual((timing.times, timing.own, timing.food), (expected.times, expected.own, expected.food))
+
+class SimulatorTest(unittest.TestCase):
+    def test_reproducible(self):
+        """ The same seed should replay the same game """
+
+        # Arrange
+        snakes = {id: simulated_move for id in ("a", "b", "c", "d")}
+
+        # Act
+        first = simulator.play(snakes, "standard", seed=7)
+        second = simulator.play(snakes, "standard", seed=7)
+
+        # Assert
+        self.assertEqual((first.winner, first.turns, first.survived), (second.winner, second.turns, second.survived))
+        self.assertEqual(max(first.survived.values()), first.turns)
+
+    def test_reproducible_royale(self):
+        """ Replaying a seed should not reuse what the server kept for the first game """
+
+        # Arrange
+        snakes = {id: simulated_move for id in ("a", "b", "c", "d")}
+
+        # Act
+        first = simulator.play(snakes, "royale", seed=3)
+        second = simulator.play(snakes, "royale", seed=3)
+
+        # Assert
+        self.assertEqual((first.winner, first.turns, first.survived), (second.winner, second.turns, second.survived))
+
+    def test_royale_shrinks(self):
+        """ Hazards should cover one more side of the board every 25 turns """
+
+        # Arrange
+        game = simulator.Game(["a"], "royale", seed=1)
+
+        # Act
+        game.play({"a": server_logic.choose_move}, max_turns=50)
+
+        # Assert
+        self.assertEqual(len(game.state.hazards), 21)
+
+    def test_constrictor_grows(self):
+        """ Snakes should grow every turn and no food should spawn """
+
+        # Arrange
+        game = simulator.Game(["a", "b"], "constrictor", seed=1)
+
+        # Act
+        game.play({"a": server_logic.choose_move, "b": server_logic.choose_move}, max_turns=5)
+
+        # Assert
+        self.assertEqual(game.state.food, set())
+        self.assertEqual(game.state.snake("a").length, simulator.START_LENGTH + 5)
+
+    def test_initial_food(self):
+        """ Starting food should be diagonal to every snake, away from the center and never in a corner """
+
+        # Arrange
+        corners = {0, 10, 110, 120}
+
+        for seed in range(8):
+            # Act
+            game = simulator.Game(["a", "b", "c", "d"], seed=seed)
+
+            # Assert
+            food = game.state.food
+            self.assertIn(5 * 11 + 5, food)
+            self.assertFalse(food & corners)
+            for snake in game.state.snakes:
+                self.assertTrue(food & set(simulator.food_options(11, 11, snake.head, set())))
+
+    def test_duel_players(self):
+        """ Duels are played by exactly two snakes """
+
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            simulator.Game(["a", "b", "c"], "duel")
+
+class TournamentTest(unittest.TestCase):
+    def test_stronger_variant(self):
+        """ The greedy strategy should beat a snake that always moves up """
+
+        # Act
+        summary = tournament.run(["greedy", "tests:always_up"], 6, "duel", seed=3, workers=2)
+
+        # Assert
+        greedy, up = summary["greedy"], summary["tests:always_up"]
+        self.assertEqual(greedy["games"], 6)
+        self.assertEqual(greedy["win_rate"], 1.0)
+        self.assertGreater(greedy["elo"], up["elo"])
+        self.assertLessEqual(greedy["elo_95"][0], greedy["elo"])
+        self.assertGreater(greedy["average_turns"], up["average_turns"])
+        self.assertGreater(greedy["latency_ms"]["p99"], 0)
+
+    def test_elo_symmetric(self):
+        """ Variants with the same results should get the same rating """
+
+        # Arrange
+        games = [{"turns": 10, "players": [("a", 10, True, []), ("b", 5, False, [])]},
+                 {"turns": 10, "players": [("a", 5, False, []), ("b", 10, True, [])]}]
+
+        # Act
+        ratings = tournament.elo(["a", "b"], games)
+
+        # Assert
+        self.assertAlmostEqual(ratings["a"], 1500)
+        self.assertAlmostEqual(ratings["b"], 1500)
+
+class BenchmarkTest(unittest.TestCase):
+    def test_corpus_reproducible(self):
+        """ The corpus should not depend on the strategy or on previous runs """
+
+        # Act
+        first = benchmark.build_payload("royale", 8, 11, 11, 40)
+        second = benchmark.build_payload("royale", 8, 11, 11, 40)
+
+        # Assert
+        self.assertEqual(first, second)
+        self.assertEqual(first["turn"], 40)
+
+    def test_distinct_games(self):
+        """ Every payload should be a game of its own """
+
+        # Act
+        corpus = benchmark.build_corpus()
+
+        # Assert
+        ids = {data["game"]["id"] for data in corpus.values()}
+        self.assertEqual(len(ids), len(benchmark.CORPUS))
+
+    def test_run(self):
+        """ The whole suite should run, end to end """
+
+        # Act
+        results = benchmark.run(budget=0.0001)
+
+        # Assert
+        self.assertEqual(set(results), {name for name, *_ in benchmark.CORPUS})
+        self.assertTrue(all(micros > 0 for functions in results.values() for micros in functions.values()))
+
+    def test_compare(self):
+        """ Only slowdowns above the threshold should be regressions """
+
+        # Arrange
+        baseline = {"empty": {"choose_move": 100.0, "create_board": 10.0}}
+        results = {"empty": {"choose_move": 120.0, "create_board": 13.0, "new_function": 5.0}}
+
+        # Act
+        regressions = benchmark.compare(results, baseline, threshold=0.25)
+
+        # Assert
+        self.assertEqual(regressions, [("empty", "create_board", 10.0, 13.0)])
+
+class WatchdogTest(unittest.TestCase):
+    def test_late_function(self):
+        """ The watchdog should give up on a function still running at the deadline """
+
+        # Arrange
+        def slow():
+            time.sleep(0.2)
+            return "down"
+
+        # Act
+        started = time.perf_counter()
+        result = watchdog.run(slow, started + 0.02)
+        elapsed = time.perf_counter() - started
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertLess(elapsed, 0.15)
+
+    def test_fallback_move(self):
+        """ choose_move should answer the safe move when the search fails """
+
+        # Arrange
+        you = make_snake("you", [(0, 0), (0, 1), (0, 2)])
+        other = make_snake("other", [(5, 5), (5, 6), (5, 7)])
+        def broken(*args):
+            raise RuntimeError("search failed")
+        search_function, server_logic.search.search = server_logic.search.search, broken
+
+        # Act
+        try:
+            move = server_logic.choose_move(make_data([you, other]), strategy="search")
+        finally:
+            server_logic.search.search = search_function
+
+        # Assert
+        self.assertEqual(move, "right")
+
+    def test_late_endgame(self):
+        """ choose_move should answer the safe move in time when the endgame search runs late """
+
+        # Arrange
+        you = make_snake("you", [(5, 2), (5, 3), (5, 4), (4, 4), (3, 4)])
+        wall = make_snake("wall", [(1, 10), (0, 10), (0, 9), (0, 8), (0, 7), (0, 6)] + [(x, 5) for x in range(11)] + [(10, 5)])
+        data = make_data([you, wall])
+        data["game"]["id"], data["game"]["timeout"] = "late-endgame", 100
+        self.addCleanup(games.store.end, data)
+        def slow(*args):
+            time.sleep(0.3)
+        self.addCleanup(setattr, endgame, "solve", endgame.solve)
+        endgame.solve = slow
+
+        # Act
+        started = time.perf_counter()
+        move = server_logic.choose_move(data, started)
+        elapsed = time.perf_counter() - started
+
+        # Assert
+        self.assertIn(move, ("down", "left", "right"))
+        self.assertLess(elapsed, 0.1)
+
+    def test_network_latency(self):
+        """ The network latency should be the engine's latency minus our own answer time """
+
+        # Arrange
+        store = games.GameStore()
+        you = make_snake("you", [(1, 1), (1, 0), (0, 0)])
+        data = make_data([you], turn=1)
+        timeout = data["game"]["timeout"]
+        game = store.turn(data)
+        default = search.get_deadline(data, 0.0, game)
+        game.elapsed = 300
+
+        # Act
+        data = make_data([you], turn=2)
+        data["you"]["latency"] = "320"
+        store.turn(data)
+
+        # Assert
+        self.assertEqual(game.network_latency(), 20)
+        self.assertAlmostEqual(default, (timeout - search.LATENCY_MARGIN_MS) / 1000)
+        self.assertAlmostEqual(search.get_deadline(data, 0.0, game), (timeout - 20 - search.NETWORK_MARGIN_MS) / 1000)
+
+class ReplayTest(unittest.TestCase):
+    def test_record_and_read(self):
+        """ Recorded requests should be streamed back in order, compressed or not """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        with tempfile.TemporaryDirectory() as directory:
+            logs = [os.path.join(directory, name) for name in ("log.jsonl", "log.jsonl.gz")]
+            for path in logs:
+                recorder = replay.Recorder(path)
+                recorder.record("start", data)
+                recorder.record("move", data, "right", 12.5)
+                recorder.close()
+
+            # Act
+            records = list(replay.read(logs))
+
+        # Assert
+        self.assertEqual([r["kind"] for r in records], ["start", "move"] * 2)
+        self.assertEqual(records[3]["data"], data)
+        self.assertEqual((records[3]["move"], records[3]["elapsed"]), ("right", 12.5))
+
+    def test_bad_record_skipped(self):
+        """ A request that cannot be encoded should be skipped without stopping the writer """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "log.jsonl")
+            recorder = replay.Recorder(path)
+
+            # Act
+            recorder.record("move", {"unencodable": {1, 2}}, "up", 1.0)
+            recorder.record("move", data, "right", 2.0)
+            recorder.close()
+            records = list(replay.read([path]))
+
+        # Assert
+        self.assertEqual([r["move"] for r in records], ["right"])
+
+    def test_bounded_queue(self):
+        """ When the writer falls behind, the oldest queued requests should be dropped """
+
+        # Arrange
+        class SlowFile:
+            def __init__(self):
+                self.lines, self.released = [], threading.Event()
+            def write(self, line):
+                self.released.wait()
+                self.lines.append(json.loads(line)["move"])
+            def flush(self): pass
+            def close(self): pass
+
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = replay.Recorder(os.path.join(directory, "log.jsonl"), size=2)
+            recorder.file.close()
+            recorder.file = slow = SlowFile()
+
+            # Act
+            recorder.record("move", data, "0", 1.0)
+            while recorder.pending: time.sleep(0.001)
+            for move in "123": recorder.record("move", data, move, 1.0)
+            slow.released.set()
+            recorder.close()
+
+        # Assert
+        self.assertEqual(slow.lines, ["0", "2", "3"])
+        self.assertEqual(recorder.dropped, 1)
+
+    def test_replay(self):
+        """ Replayed moves should be compared with the recorded ones """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])], food=[(2, 0)])
+        records = [{"kind": "start", "data": data},
+                   {"kind": "move", "data": data, "move": "right", "elapsed": 3.0},
+                   {"kind": "move", "data": data, "move": "down", "elapsed": 4.0},
+                   {"kind": "end", "data": data}]
+
+        # Act
+        report = replay.replay(records, strategy="greedy")
+
+        # Assert
+        summary = report.summary()
+        self.assertEqual((summary["moves"], summary["changed"]), (2, 1))
+        self.assertEqual(summary["recorded_ms"]["p99"], 4.0)
+
+class EvaluationTest(unittest.TestCase):
+    def setUp(self):
+        # Pocket on the left, a longer snake on the right
+        you, wall = pocket_snakes()
+        other = make_snake("other", [(3, 3), (3, 2), (3, 1), (4, 1), (4, 0), (3, 0), (3, 0)])
+        self.snakes = [you, wall, other]
+        self.board = server_logic.create_board(self.snakes, 5, 5, tails_move=True)
+        self.moves = self.board.avoid_blocked(self.board.generate_possible_moves(self.board.index(you["head"])))
+
+    def score(self) -> dict:
+        scores = evaluation.score_moves(self.board, self.moves, self.snakes, "you", [{"x": 0, "y": 3}])
+        return {move: (s.area, s.food, s.danger) for move, s in scores.items()}
+
+    def test_score_moves(self):
+        """ Should give the area, food distance and danger of every candidate move """
+
+        # Act
+        scores = self.score()
+
+        # Assert
+        self.assertEqual(scores, {"left": (2, 0, False), "right": (1, UNREACHABLE, True)})
+
+    @unittest.skipIf(evaluation.numpy is None, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        """ The NumPy evaluator should give the same results as the Python one """
+
+        # Arrange
+        python = (self.score(), evaluation.territory_by_move(self.board, self.moves, self.snakes, "you"))
+        enabled, minimum = evaluation.ENABLED, evaluation.NUMPY_MIN_CELLS
+        evaluation.ENABLED, evaluation.NUMPY_MIN_CELLS = True, 0
+
+        # Act
+        try:
+            vectorized = (self.score(), evaluation.territory_by_move(self.board, self.moves, self.snakes, "you"))
+        finally:
+            evaluation.ENABLED, evaluation.NUMPY_MIN_CELLS = enabled, minimum
+
+        # Assert
+        self.assertEqual(vectorized, python)
+
+class OpeningBookTest(unittest.TestCase):
+    def test_symmetric_lookup(self):
+        """ A position stored once should be found in its mirror images, with the move mirrored """
+
+        # Arrange
+        you = make_snake("you", [(1, 1), (1, 1), (1, 1)])
+        other = make_snake("other", [(9, 9), (9, 9), (9, 9)])
+        state = GameState.from_data(make_data([you, other], food=[(0, 2), (5, 5)]))
+        key, transform = opening_book.canonical(state, "you")
+        mirrored = GameState.from_data(make_data([make_snake("you", [(9, 1)] * 3), make_snake("other", [(1, 9)] * 3)],
+                                                 food=[(10, 2), (5, 5)]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "book.bin")
+            opening_book.write(path, {key: opening_book.transform_move(MOVES.index("up"), transform)}, max_turn=0)
+            book = opening_book.OpeningBook(path)
+
+            # Act
+            moves = book.lookup(state, "you"), book.lookup(mirrored, "you"), book.lookup(state, "other")
+            book.map.close()
+
+        # Assert
+        self.assertEqual(moves, ("up", "up", None))
+
+    def test_choose_move(self):
+        """ choose_move should play the book move when it is safe """
+
+        # Arrange
+        data = make_data([make_snake("you", [(1, 1), (1, 1), (1, 1)]), make_snake("other", [(9, 9), (9, 9), (9, 9)])], food=[(0, 1)])
+        key, transform = opening_book.canonical(GameState.from_data(data), "you")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "book.bin")
+            opening_book.write(path, {key: opening_book.transform_move(MOVES.index("right"), transform)}, max_turn=0)
+            previous, os.environ["OPENING_BOOK"] = os.environ.get("OPENING_BOOK"), path
+
+            # Act
+            try:
+                move = server_logic.choose_move(data, strategy="greedy")
+            finally:
+                opening_book._books.pop(path).map.close()
+                if previous is None: del os.environ["OPENING_BOOK"]
+                else: os.environ["OPENING_BOOK"] = previous
+
+        # Assert
+        self.assertEqual(move, "right")
+
+    def test_official_openings(self):
+        """ The book should start from every opening the official rules deal, and answer them """
+
+        # Arrange
+        states = opening_book.openings("duel", 2, 11, 11, starts=0)
+        keys = {opening_book.canonical(state, snake.id)[0] for state in states for snake in state.snakes}
+        records = [{"kind": "move", "data": simulator.Game(["you", "other"], "duel", seed=seed).request("you")} for seed in range(20)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "book.bin")
+            opening_book.write(path, {key: 0 for key in keys}, max_turn=0)
+            book = opening_book.OpeningBook(path)
+
+            # Act
+            hits, lookups = opening_book.hit_rate(book, records)
+            book.map.close()
+
+        # Assert
+        self.assertEqual(len(states), 48)
+        corners = {0, 10, 110, 120}
+        self.assertFalse(any(state.food & corners for state in states))
+        self.assertEqual((hits, lookups), (20, 20))
+
+class TimedBfsTest(unittest.TestCase):
+    def setUp(self):
+        # A snake that just ate standing across the board, its tail at the bottom
+        self.you = make_snake("you", [(0, 0), (0, 1), (0, 2)])
+        self.wall = make_snake("wall", [(2, 4), (2, 3), (2, 2), (2, 1), (2, 0), (2, 0)])
+        self.food = [{"x": 4, "y": 0}]
+        self.board = server_logic.create_board([self.you, self.wall], 5, 5, tails_move=True)
+        self.timing = TimeMap.from_snakes(self.board, [self.you, self.wall], "you", self.food)
+
+    def test_times(self):
+        """ Segments should free their cell once the segments behind them moved away, a bit later next to food """
+
+        # Arrange
+        eater = make_snake("eater", [(3, 1), (3, 2), (3, 3), (3, 3)])
+        board = Board(5, 5)
+
+        # Act
+        timing = TimeMap.from_snakes(board, [eater], "you", [{"x": 4, "y": 1}])
+
+        # Assert
+        self.assertEqual([timing.times[board.index(c)] for c in eater["body"][:3]], [5, 4, 3])
+
+    def test_path_through_moving_body(self):
+        """ Food behind a body should be reached once the body moved away """
+
+        # Arrange
+        possible_moves = self.board.avoid_blocked(self.board.generate_possible_moves(self.board.index(self.you["head"])))
+
+        # Act
+        static = server_logic.get_closer_to_food(possible_moves, self.food, self.board)
+        timed = server_logic.get_closer_to_food(possible_moves, self.food, self.board, timing=self.timing)
+        distances = timed_bfs(self.board, possible_moves, self.timing, start=1)
+
+        # Assert
+        self.assertIsNone(static)
+        self.assertEqual(timed, "right")
+        self.assertEqual(distances.distance(self.board.index(self.food[0])), 4)
+
+    def test_own_body_after_eating(self):
+        """ Our own body should stay one more turn for every food eaten on the way """
+
+        # Arrange
+        board = Board(5, 1)
+        board.cells[3] = 1
+        hungry = TimeMap(board.size)
+        hungry.times[3], hungry.own[3] = 3, 1
+        fed = TimeMap(board.size)
+        fed.times[3], fed.own[3], fed.food[1] = 3, 1, 1
+
+        # Act
+        distances = [timed_bfs(board, {"right": 0}, timing).distance(3) for timing in (hungry, fed)]
+
+        # Assert
+        self.assertEqual(distances, [3, UNREACHABLE])
+
+class HazardTest(unittest.TestCase):
+    def setUp(self):
+        # A band of hazard between the snake and the food, but for a way around past the end of its body
+        self.you = make_snake("you", [(0, 1), (1, 1), (2, 1), (3, 1)])
+        self.hazards = [(x, y) for x in range(4) for y in (2, 3)]
+        games.store.end(self.data(100, []))
+
+    def tearDown(self):
+        # The hazards of the game should not be left to the next tests
+        games.store.end(self.data(100, []))
+
+    def data(self, health: int, food: list) -> dict:
+        self.you["health"] = health
+        return make_data([self.you], food=food, width=5, height=5, hazards=self.hazards)
+
+    def cheapest_food(self, health: int, food: list) -> dict:
+        data = self.data(health, food)
+        board = Board.from_data(data)
+        game = games.GameStore().turn(data)
+        possible_moves = board.avoid_blocked(board.generate_possible_moves(board.index(self.you["head"])))
+        return cheapest_food(board, possible_moves, game.costs, health, data["board"]["food"])
+
+    def test_around_hazards(self):
+        """ The food should be reached the long way around, for less health than through the hazards """
+
+        # Act
+        found = self.cheapest_food(40, [(0, 4)])
+        move = server_logic.choose_move(self.data(40, [(0, 4)]))
+
+        # Assert
+        self.assertEqual(found, {"up": (20, 40 - 31), "down": (20, 40 - 13)})
+        self.assertEqual(move, "down")
+
+    def test_starving(self):
+        """ Food should only be found while the snake is alive on the way """
+
+        # Act
+        starving, just_alive = self.cheapest_food(12, [(0, 4)]), self.cheapest_food(13, [(0, 4)])
+
+        # Assert
+        self.assertEqual(starving, {"up": None, "down": None})
+        self.assertEqual(just_alive, {"up": None, "down": (20, 0)})
+
+    def test_food_in_hazard(self):
+        """ Food in a hazard should be reached when the snake is alive on the cell before """
+
+        # Act
+        found = self.cheapest_food(16, [(0, 3)])
+
+        # Assert
+        self.assertEqual(found, {"up": (15, 16 - 30), "down": (15, 16 - 28)})
+
+class OpponentModelTest(unittest.TestCase):
+    def test_learns_moves(self):
+        """ The move an opponent always played in a pattern should be the most likely """
+
+        # Arrange
+        model = opponents.OpponentModel()
+        board = Board(11, 11)
+        body = [board.index({"x": 5, "y": 0}), board.index({"x": 5, "y": 1}), board.index({"x": 5, "y": 2})]
+        occupancy = server_logic.create_board([make_snake("other", [(5, 0), (5, 1), (5, 2)])], 11, 11, tails_move=True)
+        key = opponents.pattern(board, occupancy, body, set(), {body[0]})
+
+        # Act
+        model.patterns = {"other": key}
+        for _ in range(opponents.MIN_OBSERVATIONS):
+            model.update(board, occupancy, {"other": body}, set(), {body[0]}, {"other": MOVES.index("right")})
+        probabilities = model.probabilities("other", key, [2, 3])
+
+        # Assert
+        self.assertGreater(probabilities[3], 0.95)
+        self.assertEqual(model.order("other", key, [2, 3]), [3])
+        self.assertEqual(model.unlikely_cells(board, {"other": body[0]}), {"other": {body[0] - 1}})
+
+    def test_game_updates(self):
+        """ The moves seen between consecutive turns should be counted under the pattern they were played from """
+
+        # Arrange
+        game = games.GameStore().get(make_data([make_snake("you", [(10, 10), (10, 9), (10, 8)])]))
+        you = make_snake("you", [(10, 10), (10, 9), (10, 8)])
+
+        # Act
+        game.update(make_data([you, make_snake("other", [(5, 1), (5, 2), (5, 3)])], turn=1))
+        before = game.model.patterns["other"]
+        game.update(make_data([you, make_snake("other", [(5, 0), (5, 1), (5, 2)])], turn=2))
+        game.update(make_data([you, make_snake("other", [(6, 0), (5, 0), (5, 1)])], turn=4))
+
+        # Assert
+        self.assertEqual(game.model.counts, {"other": {before: [0, 1, 0, 0]}})
+
+    def test_head_to_head_ignored(self):
+        """ A head to head cell should not be avoided when the opponent never moves there """
+
+        # Arrange
+        board = server_logic.create_board([], 11, 11)
+        snakes = [make_snake("you", [(4, 1), (3, 1), (2, 1)]), make_snake("other", [(5, 0), (5, 1), (5, 2), (5, 3)])]
+        possible_moves = {"up": board.index({"x": 4, "y": 2}), "down": board.index({"x": 4, "y": 0})}
+
+        # Act
+        avoided = board.avoid_head_to_head(dict(possible_moves), snakes, 3, "you")
+        kept = board.avoid_head_to_head(dict(possible_moves), snakes, 3, "you", {"other": {board.index({"x": 4, "y": 0})}})
+
+        # Assert
+        self.assertEqual(list(avoided), ["up"])
+        self.assertEqual(list(kept), ["up", "down"])
+
+class EndgameTest(unittest.TestCase):
+    def setUp(self):
+        # An opponent that just ate lies across the board, its head out of reach of the bottom half
+        self.wall = make_snake("wall", [(1, 10), (0, 10), (0, 9), (0, 8), (0, 7), (0, 6)] + [(x, 5) for x in range(11)] + [(10, 5)])
+        self.you = make_snake("you", [(5, 2), (5, 3), (5, 4), (4, 4), (3, 4)])
+
+    def solve(self, snakes: list, food: list = (), max_nodes: int = None):
+        data = make_data(snakes, food)
+        board = Board.from_data(data)
+        timing = TimeMap.from_snakes(board, snakes, "you", data["board"]["food"])
+        head = board.index(data["you"]["head"])
+        possible_moves = board.avoid_blocked(board.generate_possible_moves(head))
+        region = endgame.isolated_region(board, possible_moves, snakes, "you", timing)
+        if region is None: return None
+        return endgame.solve(board, possible_moves, region, timing, head, time.perf_counter() + 5, max_nodes=max_nodes)
+
+    def test_not_isolated(self):
+        """ No path should be searched while an opponent can reach us """
+
+        # Arrange
+        other = make_snake("other", [(9, 0), (9, 1), (9, 2)])
+
+        # Act
+        fill = self.solve([self.you, self.wall, other])
+
+        # Assert
+        self.assertIsNone(fill)
+
+    def test_longest_path(self):
+        """ The path should go through every cell of the region, our own body once it moved away """
+
+        # Act
+        fill = self.solve([self.you, self.wall])
+
+        # Assert
+        self.assertTrue(fill.complete)
+        # 71 cells out of reach of the opponent, its body included, less our head and a cell of the wrong colour
+        self.assertEqual(fill.length, 69)
+        self.assertEqual(server_logic.choose_move(make_data([self.you, self.wall])), fill.move)
+
+    def test_node_cap(self):
+        """ A capped search should stop early with the best path found so far """
+
+        # Act
+        fill = self.solve([self.you, self.wall], max_nodes=10)
+
+        # Assert
+        self.assertFalse(fill.complete)
+        self.assertLess(fill.length, 69)
+
+    def test_deadline(self):
+        """ The search of a large open region should stop at the deadline, with the best path found so far """
+
+        # Arrange
+        board = Board(11, 11)
+        head, rng = 60, random.Random(0)
+        for cell in rng.sample([c for c in range(board.size) if c != head], 12): board.cells[cell] = 1
+        region = [c for c in range(board.size) if not board.cells[c]]
+        possible_moves = board.avoid_blocked(board.generate_possible_moves(head))
+        started = time.perf_counter()
+
+        # Act
+        fill = endgame.solve(board, possible_moves, region, TimeMap(board.size), head, started + 0.05)
+
+        # Assert
+        self.assertLess(time.perf_counter() - started, 0.05 + 0.01)
+        self.assertFalse(fill.complete)
+        self.assertGreater(fill.length, 90)
+
+    def test_food_when_starving(self):
+        """ Food in the region should be eaten when the snake would starve before the end of the path """
+
+        # Arrange
+        self.you["health"] = 5
+        data = make_data([self.you, self.wall], food=[(8, 2)])
+
+        # Act
+        move = server_logic.choose_move(data)
+
+        # Assert
+        self.assertEqual(move, "right")
+
+ARENA_LIST = """<html><body><ul class="arena-dropdown-list">
+<li><a href="/arena/global/">Global Arena</a></li><li><a href="/arena/duels/">Duels</a></li>
+</ul></body></html>"""
+
+def ladder_page(rows: list) -> str:
+    """ Arena page with a ladder row for every (name, author) """
+    return "<table>" + "".join(
+        f'<tr class="ladder-row" data-snake-name="{name}" data-author-name="{author}">'
+        f'<td class="arena-leaderboard-rank"> {rank} </td><td>{name}</td></tr>'
+        for rank, (name, author) in enumerate(rows, 1)) + "</table>"
+
+class ArenaHandler(BaseHTTPRequestHandler):
+    """ Serves saved arena pages, with their ETag, over kept-alive connections """
+    protocol_version = "HTTP/1.1"
+    pages, statuses = {}, []
+
+    def do_GET(self):
+        body = self.pages[self.path].encode()
+        etag = '"%d"' % hash(body)
+        if self.headers.get("If-None-Match") == etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class RankingTest(unittest.TestCase):
+    def setUp(self):
+        ArenaHandler.pages = {
+            "/arena/global/": ARENA_LIST,
+            "/arena/duels/": ladder_page([("Other", "someone"), ("KoalaSnake2", "andrefpoliveira"), ("Third", "me")]),
+        }
+        ArenaHandler.statuses = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArenaHandler)
+        threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.cache = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache.cleanup()
+
+    def test_rankings(self):
+        """ Should read the places of every tracked snake and the number of players of every arena """
+
+        # Arrange
+        client = get_ranking.RankingClient(self.url, self.cache.name, workers=2)
+        snakes = [("KoalaSnake2", "andrefpoliveira"), ("Third", "me")]
+
+        # Act
+        rankings = client.rankings(snakes)
+
+        # Assert
+        self.assertEqual(rankings["Duels"], ({("KoalaSnake2", "andrefpoliveira"): 2, ("Third", "me"): 3}, 3))
+        self.assertEqual(rankings["Global Arena"], ({}, 0))
+
+    def test_etag_cache(self):
+        """ Unchanged pages should be revalidated and parsed from the cache """
+
+        # Arrange
+        snakes = [("KoalaSnake2", "andrefpoliveira")]
+        get_ranking.RankingClient(self.url, self.cache.name).rankings(snakes)
+        ArenaHandler.statuses = []
+
+        # Act
+        rankings = get_ranking.RankingClient(self.url, self.cache.name).rankings(snakes)
+
+        # Assert
+        self.assertEqual(ArenaHandler.statuses, [304, 304, 304])
+        self.assertEqual(rankings["Duels"], ({("KoalaSnake2", "andrefpoliveira"): 2}, 3))
+
+    def test_update_readme(self):
+        """ Known arenas should be updated in place and new ones appended to the table """
+
+        # Arrange
+        lines = ["# KoalaSnake\n", "\n", "## Ranking (Updated once a day)\n",
+                 "| Gamemode | Current Place | Best Place | Ranking Difference | Total Players |\n",
+                 "|:--------:|:-------------:|:----------:|:------------------:|:-------------:|\n",
+                 "| Duels | 53 | 39 | 9 | 72 |\n", "\n"]
+
+        # Act
+        lines = get_ranking.update_readme(lines, {"Duels": (30, 80), "Wrapped": (5, 40), "Royale": (None, 10)})
+
+        # Assert
+        self.assertEqual(lines[5:8], ["| Duels | 30 | 30 | -23 | 80 |\n", "| Wrapped | 5 | 5 | 0 | 40 |\n", "\n"])
+
+def busy(seconds: float):
+    """ Keeps the thread running for a while, for the sampler to see it """
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def unrelated_work(seconds: float):
+    """ Runs in a thread that has nothing to do with the turn being profiled """
+    busy(seconds)
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.saved = profiler.ENABLED, profiler.FRACTION, profiler.buffer
+        profiler.ENABLED, profiler.FRACTION = True, 0.5
+        profiler.buffer = profiler.RingBuffer(self.directory.name, keep=2)
+
+    def tearDown(self):
+        profiler.ENABLED, profiler.FRACTION, profiler.buffer = self.saved
+        self.directory.cleanup()
+
+    def wait_for_turns(self, count: int) -> list:
+        for _ in range(100):
+            if len(profiler.buffer.names()) >= count: break
+            time.sleep(0.01)
+        return profiler.buffer.summaries()
+
+    def test_slow_turn_kept(self):
+        """ A turn over the fraction of its timeout should be kept with stacks through the code that ran """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        data["game"]["timeout"] = 100
+
+        # Act
+        with profiler.turn() as profile:
+            profile.data = data
+            busy(0.08)
+        kept = self.wait_for_turns(1)
+
+        # Assert
+        self.assertEqual(len(kept), 1)
+        turn = profiler.buffer.load(kept[0]["id"])
+        self.assertEqual(turn["data"], data)
+        self.assertTrue(any("tests.py:busy" in line for line in profiler.collapsed(turn).splitlines()))
+
+    def test_turn_threads_only(self):
+        """ Only the request thread and its watchdog thread should be sampled, not other threads """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        data["game"]["timeout"] = 100
+        other = threading.Thread(target=unrelated_work, args=(0.15,))
+        other.start()
+
+        # Act
+        with profiler.turn() as profile:
+            profile.data = data
+            watchdog.run(lambda: busy(0.08), time.perf_counter() + 0.1)
+        other.join()
+        kept = self.wait_for_turns(1)
+
+        # Assert
+        stacks = profiler.collapsed(profiler.buffer.load(kept[0]["id"])).splitlines()
+        self.assertTrue(any("watchdog.py:_run" in line and "tests.py:busy" in line for line in stacks))
+        self.assertFalse(any("unrelated_work" in line for line in stacks))
+
+    def test_fast_turn_dropped(self):
+        """ A turn well within its timeout should not be kept """
+
+        # Arrange
+        data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+
+        # Act
+        with profiler.turn() as profile:
+            profile.data = data
+        time.sleep(0.05)
+
+        # Assert
+        self.assertEqual(profiler.buffer.names(), [])
+
+    def test_ring_buffer(self):
+        """ Only the last turns should be kept """
+
+        # Arrange
+        profile = profiler.TurnProfile()
+        profile.data = make_data([make_snake("you", [(0, 0), (0, 1), (0, 2)])])
+        profile.stacks.update({"server.py:handle_move;search.py:run": 3})
+
+        # Act
+        ids = [profiler.buffer.save(profile) for _ in range(3)]
+
+        # Assert
+        self.assertEqual([s["id"] for s in profiler.buffer.summaries()], ids[:0:-1])
+        self.assertEqual(profiler.collapsed(profiler.buffer.load(ids[-1])), "server.py:handle_move;search.py:run 3\n")
+        self.assertIsNone(profiler.buffer.load("../" + ids[-1]))
+
+class MetricsTest(unittest.TestCase):
+    def test_render(self):
+        """ Histograms should be rendered with cumulative buckets, sum, count and recent quantiles """
+
+        # Arrange
+        registry = metrics.Registry()
+        registry.register("stage_seconds", "Time per stage", (0.01, 0.1))
+        for value in (0.005, 0.05, 0.5):
+            registry.observe("stage_seconds", value, (("stage", "search"),))
+
+        # Act
+        lines = registry.render().splitlines()
+
+        # Assert
+        self.assertIn('stage_seconds_bucket{stage="search",le="0.01"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="search",le="0.1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="search",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_count{stage="search"} 3', lines)
+        self.assertIn('stage_seconds_recent{stage="search",quantile="0.5"} 0.05', lines)
+        self.assertIn('stage_seconds_recent_count{stage="search"} 3', lines)
+        self.assertTrue(any(line.startswith('stage_seconds_recent_sum{stage="search"} 0.55') for line in lines))
+        self.assertIn("# TYPE stage_seconds histogram", lines)
+
+    def test_filter_spans(self):
+        """ Every filter of choose_move should be timed in its own stage """
+
+        # Arrange
+        enabled, metrics.ENABLED = metrics.ENABLED, True
+        self.addCleanup(setattr, metrics, "ENABLED", enabled)
+        data = make_data([make_snake("you", [(1, 1), (1, 0), (0, 0)])], hazards=[(5, 5)])
+        data["game"]["id"] = "metrics"
+        self.addCleanup(games.store.end, data)
+
+        # Act
+        server_logic.choose_move(data, strategy="greedy")
+
+        # Assert
+        stages = {dict(labels)["stage"] for name, labels in metrics.registry.metrics if name == "battlesnake_stage_seconds"}
+        self.assertLessEqual({"avoid_blocked", "avoid_head_to_head", "avoid_hazards"}, stages)
+
+    def test_disabled_span(self):
+        """ Spans should record nothing while metrics are disabled """
+
+        # Arrange
+        enabled, metrics.ENABLED = metrics.ENABLED, False
+        before = len(metrics.registry.metrics)
+
+        # Act
+        try:
+            with metrics.span("board"):
+                pass
+            metrics.observe("battlesnake_search_nodes", 10, engine="search")
+        finally:
+            metrics.ENABLED = enabled
+
+        # Assert
+        self.assertEqual(len(metrics.registry.metrics), before)
+
 if __name__ == "__main__":
     unittest.main()
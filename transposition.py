@@ -0,0 +1,83 @@
+import random
+
+from rules import GameState
+
+HEALTH_BUCKETS = 10
+TABLE_SIZE = 1 << 14
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class Zobrist:
+    """ Random 64 bit keys for every (cell, occupant, health bucket) feature of a board """
+
+    def __init__(self, size: int, seed: int = 0):
+        rng = random.Random(seed)
+        self.size = size
+        self.slots = 0
+        self.heads, self.bodies, self.tails, self.health = [], [], [], []
+        self.food = [rng.getrandbits(64) for _ in range(size)]
+        self.rng = rng
+
+    def add_slots(self, slots: int):
+        """ Keys for one more snake are generated lazily, as snakes are identified by their position in the state """
+        rng, size = self.rng, self.size
+        while self.slots < slots:
+            self.heads.append([rng.getrandbits(64) for _ in range(size)])
+            self.bodies.append([rng.getrandbits(64) for _ in range(size)])
+            self.tails.append([rng.getrandbits(64) for _ in range(size)])
+            self.health.append([rng.getrandbits(64) for _ in range(HEALTH_BUCKETS + 1)])
+            self.slots += 1
+
+    def hash(self, state: GameState) -> int:
+        if self.slots < len(state.snakes): self.add_slots(len(state.snakes))
+        key = 0
+        for i, snake in enumerate(state.snakes):
+            if not snake.alive: continue
+            body, bodies = snake.body, self.bodies[i]
+            key ^= self.heads[i][body[0]] ^ self.tails[i][body[-1]]
+            key ^= self.health[i][snake.health * HEALTH_BUCKETS // 100]
+            for cell in body[1:]:
+                key ^= bodies[cell]
+        food = self.food
+        for cell in state.food:
+            key ^= food[cell]
+        return key
+
+_zobrist_cache = {}
+
+def get_zobrist(size: int) -> Zobrist:
+    """ Keys are shared by every game played on boards with the same number of cells """
+    if size not in _zobrist_cache: _zobrist_cache[size] = Zobrist(size)
+    return _zobrist_cache[size]
+
+class TranspositionTable:
+    """
+    Fixed number of slots indexed by hash, so memory stays bounded however long the game is.
+    A slot is replaced when it holds a different position from an older search or a shallower one.
+    """
+
+    def __init__(self, size: int, capacity: int = TABLE_SIZE):
+        self.zobrist = get_zobrist(size)
+        self.capacity = capacity
+        self.slots = {}
+        self.generation = 0
+        self.hits = 0
+
+    def new_search(self):
+        """ Called once per turn so entries from previous turns are replaced first """
+        self.generation += 1
+
+    def get(self, key: int) -> tuple:
+        """ (depth, value, flag, move) stored for the position, or None """
+        entry = self.slots.get(key % self.capacity)
+        if entry is None or entry[0] != key: return None
+        self.hits += 1
+        return entry[1:5]
+
+    def put(self, key: int, depth: int, value: float, flag: int, move: int):
+        index = key % self.capacity
+        entry = self.slots.get(index)
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, value, flag, move, self.generation)
+
+    def __len__(self) -> int:
+        return len(self.slots)
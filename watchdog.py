@@ -0,0 +1,48 @@
+import threading
+import time
+import traceback
+
+import profiler
+import search
+
+# Time the search gets past its own deadline before the watchdog answers without it
+SLACK_MS = 20
+
+class Watchdog:
+    """ Runs a function in a thread and gives up waiting for it at a hard deadline """
+    __slots__ = ("function", "result", "error", "done", "profile")
+
+    def __init__(self, function):
+        self.function = function
+        self.result = self.error = None
+        self.done = threading.Event()
+        # The thread works on the turn being answered, it is sampled with it when the turn is profiled
+        self.profile = profiler.current()
+
+    def _run(self):
+        profiler.join(self.profile)
+        try:
+            self.result = self.function()
+        except Exception as error:
+            # A failing search must not cost the turn, the fallback answers instead
+            traceback.print_exc()
+            self.error = error
+        finally:
+            self.done.set()
+
+    def wait(self, deadline: float):
+        """
+        Result of the function, or None if it did not return by the deadline (a perf_counter time)
+        or raised. A late function is left to finish in the background, its result is dropped.
+        """
+        threading.Thread(target=self._run, daemon=True).start()
+        if not self.done.wait(max(0.0, deadline - time.perf_counter())): return None
+        return self.result
+
+def get_deadline(data: dict, started: float, game = None) -> float:
+    """ perf_counter time by which an answer is sent, whether the search returned or not """
+    return search.get_deadline(data, started, game) + SLACK_MS / 1000
+
+def run(function, deadline: float):
+    """ Result of function(), or None when it is too late or it failed """
+    return Watchdog(function).wait(deadline)